@@ -1,8 +1,18 @@
-import requests
-from csv import DictReader
-import urllib3
-import sys
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+import argparse
+
+from ctfd_client import create_session, add_url_argument, add_pool_argument, default_url, default_pool_size
+from ctfd_state import fetch_account_state
+from journal import open_journal, add_journal_arguments, default_journal_path
+from pipeline import Stage, monitor
+from rosters import open_roster, add_roster_arguments
+from mailer import MailDatabase, add_mail_database_argument, accounts_database
+from instrumentation import progress, instrumented_run, add_instrumentation_arguments
+
+# Default roster path, another one is given with --roster
+csv_file_path = "/home/ubuntu/ctfd_automation/csv_files/team_and_users.csv"
+
+# Maximum number of items waiting between two pipeline stages
+default_queue_size = 100
 
 def create_team(session, base_url, team_name, team_password):
     """Create a team with a specific password"""
@@ -11,22 +21,23 @@ def create_team(session, base_url, team_name, team_password):
         "password": team_password  
     }
     
-    r = session.post(f"{base_url}/api/v1/teams", json=team_data, headers={"Content-Type": "application/json"}, verify=False)
+    r = session.post(f"{base_url}/api/v1/teams", json=team_data, verify=False)
     
     if r.status_code == 200:
         team_id = r.json()["data"]["id"]
-        print(f"Team '{team_name}' created with ID {team_id}")
+        progress.ok("team", team_name, id=team_id)
         return team_id
     else:
-        print(f"Failed to create team '{team_name}': {r.status_code} - {r.text}")
+        progress.fail("team", team_name, f"{r.status_code} - {r.text}")
         return None
 
-def create_user(session, base_url, email, password):
+def create_user(session, base_url, email, password, notify=False):
     """Create a user with username derived from the email"""
     username = email.split('@')[0]  # Derive username from email
     
     r = session.post(
-        f"{base_url}/api/v1/users?notify=true",  # Notify sends email with credentials
+        # Credentials are mailed afterwards by mailer.py; notify makes CTFd send them inside the request
+        f"{base_url}/api/v1/users?notify=true" if notify else f"{base_url}/api/v1/users",
         json={
             "name": username,
             "email": email,
@@ -37,62 +48,144 @@ def create_user(session, base_url, email, password):
             "banned": False,
             "fields": [],
         },
-        headers={"Content-Type": "application/json"},
         verify=False
     )
 
     if r.status_code == 200:
         user_id = r.json()["data"]["id"]
-        print(f"User created successfully: Username: {username}, Password: {password}, Email: {email}")
+        progress.ok("user", email, id=user_id, name=username)
         return user_id
     else:
-        print(f"Failed to create user {username}. Status: {r.status_code}. Response: {r.text}")
+        progress.fail("user", email, f"{r.status_code} - {r.text}")
         return None
 
 def add_user_to_team(session, base_url, team_id, user_id):
     """Add a user to an existing team by team ID"""
     r = session.post(f"{base_url}/api/v1/teams/{team_id}/members", 
                      json={"user_id": user_id},
-                     headers={"Content-Type": "application/json"},
                      verify=False)
     
     if r.status_code == 200:
-        print(f"User with ID {user_id} added to team ID {team_id}")
+        progress.ok("membership", user_id, team_id=team_id)
+        return True
     else:
-        print(f"Failed to add user {user_id} to team {team_id}: {r.status_code} - {r.text}")
-
-def main():
-    url = "https://127.0.0.1"  # Your CTFd URL
-    token = sys.argv[1]  
+        progress.fail("membership", user_id, f"team {team_id}: {r.status_code} - {r.text}")
+        return False
 
+def main(token, pool_size=default_pool_size, team_workers=2, user_workers=8, link_workers=4,
+         queue_size=default_queue_size, report_interval=0, sync=False,
+         journal_path=default_journal_path, resume=False, notify=False, url=default_url,
+         roster_path=csv_file_path, skip_invalid=False, mail_database=accounts_database):
     # Create API session
     url = url.strip("/")
-    s = requests.Session()
-    s.headers.update({"Authorization": f"Token {token}"})
+    s = create_session(token, pool_size)
+
+    # Malformed members, bad emails and duplicates are reported before the first call
+    roster = open_roster(roster_path, "teams", skip_invalid)
+
+    # Sync mode reuses the teams, users and memberships that already exist
+    state = fetch_account_state(s, url, teams=True) if sync else None
+    if state:
+        print(f"Found {len(state.teams)} existing teams and {len(state.users)} existing users.")
+
+    # Completed steps are journaled, keyed by team name or member email
+    journal = open_journal(journal_path, "teams", resume, sync)
 
-    # Read teams_and_members.csv
-    teams = DictReader(open("/home/ubuntu/ctfd_automation/csv_files/team_and_users.csv"))
+    # Without notify, mailer.py sends the credentials of the created users from this file
+    mail = MailDatabase(mail_database, ["username", "email", "password", "team"], append=resume or sync) \
+        if mail_database and not notify else None
 
-    for team in teams:
-        team_name = team["team"]
-        team_password = team["team_password"]
-        members = team["members"].split("|")  # Split members by pipe character
+    # Teams, users and memberships are created by three concurrent stages, so
+    # the users of the next team are created while memberships are added
+    def link_member(item):
+        team_id, user_id, email = item
+        if add_user_to_team(s, url, team_id, user_id):
+            journal.record(email, "member", team_id)
+
+    def create_member(item):
+        team_id, team_name, email, password = item
+        if journal.done(email, "member"):
+            return
+        existing = state.user(email) if state else None
+        if existing:
+            if existing.get("team_id") == team_id:
+                return
+            user_id = existing["id"]
+        else:
+            user_id = journal.get(email, "user")
+            if not user_id:
+                user_id = create_user(s, url, email, password, notify)
+                if user_id:
+                    journal.record(email, "user", user_id)
+                    if mail:
+                        mail.add(username=email.split('@')[0], email=email, password=password, team=team_name)
+        if user_id:
+            # Membership is only linked once both IDs exist
+            link_stage.put((team_id, user_id, email))
+
+    def create_team_and_queue_members(team):
+        team_name = team["name"]
+        team_password = team["password"]
 
         # Create the team and get the team ID
-        team_id = create_team(s, url, team_name, team_password)
+        existing = state.teams.get(team_name) if state else None
+        team_id = existing["id"] if existing else journal.get(team_name, "team")
         if not team_id:
-            continue  # If team creation failed, skip to the next team
-
-        # Add each member to the team
-        for i in range(0, len(members), 3):
-            email = members[i + 2]
-            password = members[i + 1]
-            
-            # Create user
-            user_id = create_user(s, url, email, password)
-            if user_id:
-                # Add the user to the team
-                add_user_to_team(s, url, team_id, user_id)
+            team_id = create_team(s, url, team_name, team_password)
+            if not team_id:
+                return  # If team creation failed, skip its members
+            journal.record(team_name, "team", team_id)
+
+        for member in team["members"]:
+            user_stage.put((team_id, team_name, member["email"], member["password"]))
+
+    link_stage = Stage("memberships", link_member, link_workers, queue_size).start()
+    user_stage = Stage("users", create_member, user_workers, queue_size).start()
+    team_stage = Stage("teams", create_team_and_queue_members, team_workers, queue_size).start()
+    stages = [team_stage, user_stage, link_stage]
+    stop_monitor = monitor(stages, report_interval) if report_interval else None
+
+    # The roster is read a row at a time, as fast as the bounded team queue takes them
+    for team in roster:
+        team_stage.put(team)
+
+    # Drain the stages in pipeline order
+    for stage in stages:
+        stage.close()
+    if stop_monitor:
+        stop_monitor.set()
+    journal.close()
+    if mail:
+        mail.close()
+
+    print("\nPipeline summary:")
+    for stage in stages:
+        print(f"  {stage.summary()}")
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Create CTFd teams and their members from a CSV or JSON "
+                                                 "lines file")
+    parser.add_argument("token", help="CTFd admin API token")
+    parser.add_argument("--team-workers", type=int, default=2, help="parallel team creation calls (default: 2)")
+    parser.add_argument("--user-workers", type=int, default=8, help="parallel user creation calls (default: 8)")
+    parser.add_argument("--link-workers", type=int, default=4, help="parallel membership calls (default: 4)")
+    parser.add_argument("--queue-size", type=int, default=default_queue_size,
+                        help=f"maximum items waiting between two stages (default: {default_queue_size})")
+    parser.add_argument("--report-interval", type=float, default=0,
+                        help="print queue depth and throughput of every stage every N seconds")
+    parser.add_argument("--sync", action="store_true",
+                        help="only create the teams, users and memberships that are not on CTFd yet")
+    parser.add_argument("--notify", action="store_true",
+                        help="have CTFd email the credentials while creating each user, instead of mailer.py")
+    add_roster_arguments(parser, csv_file_path)
+    add_mail_database_argument(parser)
+    add_url_argument(parser)
+    add_pool_argument(parser)
+    add_journal_arguments(parser)
+    add_instrumentation_arguments(parser)
+    args = parser.parse_args()
+    with instrumented_run(args.metrics, args.trace, args.progress_interval, args.progress_log):
+        main(args.token, args.pool_size, args.team_workers, args.user_workers, args.link_workers,
+             args.queue_size, args.report_interval, args.sync, args.journal, args.resume,
+             args.notify, args.url, args.roster, args.skip_invalid,
+             args.mail_database)
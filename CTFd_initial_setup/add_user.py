@@ -1,27 +1,43 @@
-import sys
+import time
+import argparse
+import threading
 import requests
-from csv import DictReader
-import urllib3
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-
-def main():
-    url = "https://127.0.0.1"  # Your CTFd URL
-    token = sys.argv[1]
-    
-    # Create API Session
-    url = url.rstrip("/")  # Remove trailing slash if present
-    s = requests.Session()
-    s.headers.update({"Authorization": f"Token {token}"})
+from csv import DictWriter
+
+from ctfd_client import (create_session, request_with_retry, add_url_argument, add_pool_argument,
+                         add_retry_arguments, default_url, default_pool_size, default_retries, default_backoff)
+from ctfd_state import fetch_account_state, find_user
+from journal import open_journal, add_journal_arguments, default_journal_path
+from pipeline import Stage
+from rosters import open_roster, add_roster_arguments
+from mailer import MailDatabase, add_mail_database_argument, accounts_database
+from instrumentation import progress, instrumented_run, add_instrumentation_arguments
 
-    # Read users.csv with username, email, and password
-    users = DictReader(open("/home/ubuntu/ctfd_automation/csv_files/users.csv"))
+# Default roster path, another one is given with --roster
+csv_file_path = "/home/ubuntu/ctfd_automation/csv_files/users.csv"
 
-    for user in users:
+# Number of users created in parallel
+default_workers = 8
+
+def email_taken(response):
+    try:
+        return "email" in (response.json().get("errors") or {})
+    except ValueError:
+        return False
+
+def create_user(session, url, user, retries=default_retries, backoff=default_backoff, notify=False):
+    """Create one user from a roster record, returning (user_id, latency, error)"""
+    start = time.perf_counter()
+    try:
         # Post the user data to create the account
-        r = s.post(
-            f"{url}/api/v1/users?notify=true",  # Notify sends email with credentials
+        r = request_with_retry(
+            session, "POST",
+            # Credentials are mailed afterwards by mailer.py; notify makes CTFd send them inside the request
+            f"{url}/api/v1/users?notify=true" if notify else f"{url}/api/v1/users",
+            retries=retries,
+            backoff=backoff,
             json={
-                "name": user["username"],  # Use username for the "name" field
+                "name": user["name"],  # The username column of the CSV
                 "email": user["email"],
                 "password": user["password"],
                 "type": "user",  # Set account type to "user"
@@ -30,14 +46,150 @@ def main():
                 "banned": False,  # User ban status
                 "fields": [],  # No additional fields
             },
-            headers={"Content-Type": "application/json"},
             verify=False
         )
-        # Output response
-        if r.status_code == 200:
-            print(f"User created successfully: Username: {user['username']}, Password: {user['password']}, Email: {user['email']}")
+    except requests.ConnectionError as e:
+        return None, time.perf_counter() - start, str(e)
+    latency = time.perf_counter() - start
+
+    # Output response
+    if r.status_code == 200:
+        user_id = r.json()["data"]["id"]
+        progress.ok("user", user["email"], id=user_id, name=user["name"])
+        return user_id, latency, None
+    elif r.status_code == 400 and r.attempts > 1 and email_taken(r):
+        # An earlier attempt was committed before its response got lost, so the retry finds the email taken
+        try:
+            user_id = find_user(session, url, user["email"])
+        except requests.RequestException:
+            user_id = None
+        if user_id:
+            progress.ok("user", user["email"], id=user_id, name=user["name"], recovered=True)
+            return user_id, latency, None
+        progress.fail("user", user["email"], f"{r.status_code} - {r.text}")
+        return None, latency, f"{r.status_code} - {r.text}"
+    else:
+        progress.fail("user", user["email"], f"{r.status_code} - {r.text}")
+        return None, latency, f"{r.status_code} - {r.text}"
+
+def update_user(session, url, user_id, update_data, retries=default_retries, backoff=default_backoff):
+    """Update fields of an existing user"""
+    r = request_with_retry(session, "PATCH", f"{url}/api/v1/users/{user_id}", retries=retries, backoff=backoff,
+                           json=update_data, verify=False)
+    if r.status_code == 200:
+        progress.ok("user update", user_id, fields=list(update_data))
+    else:
+        progress.fail("user update", user_id, f"{r.status_code} - {r.text}")
+
+def percentile(values, p):
+    """Nearest-rank percentile of an already sorted list"""
+    if not values:
+        return 0.0
+    index = max(0, min(len(values) - 1, round(p / 100 * len(values)) - 1))
+    return values[index]
+
+def print_report(created, elapsed, latencies, failed):
+    latencies = sorted(latencies)
+    print(f"\nCreated {created} users in {elapsed:.2f}s ({created / elapsed if elapsed else 0:.1f} users/sec)")
+    print("Latency p50: {:.0f} ms, p95: {:.0f} ms, p99: {:.0f} ms".format(
+        *(percentile(latencies, p) * 1000 for p in (50, 95, 99))))
+    if failed:
+        print(f"{len(failed)} users failed:")
+        for user, error in failed:
+            print(f"  {user['name']} <{user['email']}>: {error}")
+
+def main(token, pool_size=default_pool_size, workers=default_workers, retries=default_retries,
+         backoff=default_backoff, failed_csv=None, sync=False, journal_path=default_journal_path, resume=False,
+         notify=False, url=default_url, roster_path=csv_file_path, skip_invalid=False,
+         mail_database=accounts_database):
+    # Create API Session
+    url = url.rstrip("/")  # Remove trailing slash if present
+    s = create_session(token, pool_size)
+
+    # users.csv (username, email, password) is checked before the first call, then streamed row by row
+    roster = open_roster(roster_path, "users", skip_invalid)
+
+    # Users recorded in the journal by an interrupted run are not sent again
+    journal = open_journal(journal_path, "users", resume, sync)
+
+    # Sync mode only creates the users whose email is not registered yet
+    state = fetch_account_state(s, url) if sync else None
+
+    # Without notify, mailer.py sends the credentials of the created users from this file
+    mail = MailDatabase(mail_database, ["username", "email", "password"], append=resume or sync) \
+        if mail_database and not notify else None
+
+    lock = threading.Lock()
+    latencies, failed = [], []
+
+    def provision(item):
+        user, existing_id = item
+        if existing_id:
+            update_user(s, url, existing_id, {"name": user["name"]}, retries, backoff)
+            return
+        user_id, latency, error = create_user(s, url, user, retries, backoff, notify)
+        if user_id:
+            journal.record(user["email"], "user", user_id)
+            if mail:
+                mail.add(username=user["name"], email=user["email"], password=user["password"])
+        with lock:
+            latencies.append(latency)
+            if not user_id:
+                failed.append((user, error))
+
+    # The bounded queue keeps the reader at most a queue ahead of the calls
+    stage = Stage("users", provision, workers).start()
+    queued = existing = updates = 0
+    start = time.perf_counter()
+    for user in roster:
+        if journal.done(user["email"], "user"):
+            continue
+        found = state.user(user["email"]) if state else None
+        if found:
+            existing += 1
+            if found.get("name") == user["name"]:
+                continue
+            updates += 1
         else:
-            print(f"Failed to create user {user['username']}. Status: {r.status_code}. Response: {r.text}")
+            queued += 1
+        stage.put((user, found["id"] if found else None))
+    stage.close()
+    elapsed = time.perf_counter() - start
+    journal.close()
+    if mail:
+        mail.close()
+
+    if sync:
+        print(f"{existing} users already existed, {updates} of them were updated.")
+    print_report(queued - len(failed), elapsed, latencies, failed)
+
+    # Failed rows can be fed back to the script once the cause is fixed
+    if failed and failed_csv:
+        with open(failed_csv, 'w', newline='') as csvfile:
+            writer = DictWriter(csvfile, fieldnames=["username", "email", "password"])
+            writer.writeheader()
+            writer.writerows({"username": user["name"], "email": user["email"], "password": user["password"]}
+                             for user, _ in failed)
+        print(f"Failed rows written to {failed_csv}")
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Create CTFd users from a CSV or JSON lines file")
+    parser.add_argument("token", help="CTFd admin API token")
+    parser.add_argument("--workers", type=int, default=default_workers,
+                        help=f"number of users created in parallel (default: {default_workers})")
+    parser.add_argument("--failed-csv", help="write the rows that could not be created to this CSV file")
+    parser.add_argument("--sync", action="store_true", help="only create users whose email is not on CTFd yet")
+    parser.add_argument("--notify", action="store_true",
+                        help="have CTFd email the credentials while creating each user, instead of mailer.py")
+    add_roster_arguments(parser, csv_file_path)
+    add_mail_database_argument(parser)
+    add_url_argument(parser)
+    add_pool_argument(parser)
+    add_retry_arguments(parser)
+    add_journal_arguments(parser)
+    add_instrumentation_arguments(parser)
+    args = parser.parse_args()
+    with instrumented_run(args.metrics, args.trace, args.progress_interval, args.progress_log):
+        main(args.token, args.pool_size, args.workers, args.retries, args.backoff, args.failed_csv, args.sync,
+             args.journal, args.resume, args.notify, args.url, args.roster, args.skip_invalid,
+             args.mail_database)
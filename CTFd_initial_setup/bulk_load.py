@@ -0,0 +1,184 @@
+import sys
+import time
+import argparse
+
+from sqlalchemy import create_engine, select, update, func, bindparam, and_
+
+from passwords import hash_passwords
+from rosters import read_users, read_teams, users_csv_path, teams_csv_path
+
+# Adjust the Python path to include CTFd module directory, as in get_api.py
+sys.path.append('/opt/CTFd')  # Update this path if necessary
+
+from CTFd.models import Users, Teams, db
+
+DATABASE_URL = "mysql+pymysql://ctfd:ctfd@db:3306/ctfd"
+
+# Rows per INSERT statement and per IN (...) lookup
+batch_size = 500
+
+
+def batches(items, size=batch_size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def lookup(conn, table, key_column, keys, columns):
+    """Map each existing key to its row, with one IN (...) query per batch.
+
+    Emails are compared case-insensitively, as CTFd does on registration.
+    """
+    rows = {}
+    lower = key_column.name == "email"
+    for batch in batches(list(keys)):
+        column = func.lower(key_column) if lower else key_column
+        values = [k.lower() for k in batch] if lower else batch
+        for row in conn.execute(select(key_column, *columns).where(column.in_(values))):
+            rows[row[0].lower() if lower else row[0]] = row
+    return rows
+
+
+def insert_users(conn, users, processes=None):
+    """Insert the users whose email is not taken yet, returning {email: user id}.
+
+    ``users`` is a list of dicts with name, email and password.
+    """
+    existing = lookup(conn, Users.__table__, Users.__table__.c.email, {u["email"] for u in users},
+                      [Users.__table__.c.id])
+    # CTFd refuses a second account with the same email or name, so does the bulk load
+    taken = set(lookup(conn, Users.__table__, Users.__table__.c.name, {u["name"] for u in users}, []))
+    seen, new = set(existing), []
+    for user in users:
+        if user["email"].lower() in seen:
+            continue
+        if user["name"] in taken:
+            print(f"Skipping user {user['email']}: the name {user['name']} is already taken")
+            continue
+        seen.add(user["email"].lower())
+        taken.add(user["name"])
+        new.append(user)
+    print(f"{len(existing)} users already exist, {len(new)} to create.")
+
+    start = time.perf_counter()
+    hashes = hash_passwords([u["password"] for u in new], processes)
+    print(f"Hashed {len(hashes)} passwords in {time.perf_counter() - start:.1f}s.")
+
+    for batch in batches(list(zip(new, hashes))):
+        conn.execute(Users.__table__.insert(), [
+            {
+                "name": user["name"],
+                "email": user["email"],
+                "password": hashed,
+                "type": "user",
+                "verified": True,
+                "hidden": False,
+                "banned": False,
+            }
+            for user, hashed in batch
+        ])
+
+    ids = lookup(conn, Users.__table__, Users.__table__.c.email, {u["email"] for u in users},
+                 [Users.__table__.c.id])
+    return {email: row.id for email, row in ids.items()}
+
+
+def insert_teams(conn, teams, processes=None):
+    """Insert the teams whose name is not taken yet, returning {team name: team id}"""
+    existing = lookup(conn, Teams.__table__, Teams.__table__.c.name, {t["name"] for t in teams},
+                      [Teams.__table__.c.id])
+    new = list({t["name"]: t for t in teams if t["name"] not in existing}.values())
+    print(f"{len(existing)} teams already exist, {len(new)} to create.")
+
+    hashes = hash_passwords([t["password"] for t in new], processes)
+    for batch in batches(list(zip(new, hashes))):
+        conn.execute(Teams.__table__.insert(), [
+            {"name": team["name"], "password": hashed, "hidden": False, "banned": False}
+            for team, hashed in batch
+        ])
+
+    ids = lookup(conn, Teams.__table__, Teams.__table__.c.name, {t["name"] for t in teams},
+                 [Teams.__table__.c.id])
+    return {name: row.id for name, row in ids.items()}
+
+
+def link_members(conn, memberships):
+    """Set team_id of users that are in no team yet and make the first linked member captain.
+
+    ``memberships`` is a list of (team id, user id) in CSV order.
+    """
+    users = Users.__table__
+    teams = Teams.__table__
+    rows = [{"b_user": user_id, "b_team": team_id} for team_id, user_id in memberships]
+    for batch in batches(rows):
+        conn.execute(
+            update(users).where(and_(users.c.id == bindparam("b_user"), users.c.team_id.is_(None)))
+            .values(team_id=bindparam("b_team")),
+            batch
+        )
+
+    # Members already in another team are reported rather than moved
+    current = lookup(conn, users, users.c.id, {u for _, u in memberships}, [users.c.team_id])
+    linked = [(t, u) for t, u in memberships if current[u].team_id == t]
+    for team_id, user_id in memberships:
+        if current[user_id].team_id != team_id:
+            print(f"User {user_id} is already in team {current[user_id].team_id}, not added to team {team_id}")
+
+    captains = {}
+    for team_id, user_id in linked:
+        captains.setdefault(team_id, user_id)
+    for batch in batches([{"b_team": t, "b_user": u} for t, u in captains.items()]):
+        conn.execute(
+            update(teams).where(and_(teams.c.id == bindparam("b_team"), teams.c.captain_id.is_(None)))
+            .values(captain_id=bindparam("b_user")),
+            batch
+        )
+    return len(linked)
+
+
+def main(mode, csv_path=None, database_url=DATABASE_URL, processes=None, create_schema=False):
+    engine = create_engine(database_url)
+    if create_schema:
+        # For testing against an empty SQLite file
+        db.metadata.create_all(engine)
+
+    start = time.perf_counter()
+    # Everything is written in one transaction: a failed load leaves the database untouched
+    with engine.begin() as conn:
+        if mode == "users":
+            users = read_users(csv_path or users_csv_path)
+            ids = insert_users(conn, users, processes)
+            print(f"{len(ids)} users in the database.")
+        else:
+            teams = read_teams(csv_path or teams_csv_path)
+            user_ids = insert_users(conn, [m for t in teams for m in t["members"]], processes)
+            team_ids = insert_teams(conn, teams, processes)
+            # Members skipped by insert_users (name taken by another account) have no ID to link
+            memberships, unlinked = [], []
+            for t in teams:
+                for m in t["members"]:
+                    user_id = user_ids.get(m["email"].lower())
+                    if user_id and team_ids.get(t["name"]):
+                        memberships.append((team_ids[t["name"]], user_id))
+                    else:
+                        unlinked.append((t["name"], m["email"]))
+            linked = link_members(conn, memberships)
+            print(f"{len(team_ids)} teams and {linked} memberships in the database.")
+            if unlinked:
+                print(f"{len(unlinked)} members were not added to their team, they have no account:")
+                for team_name, email in unlinked:
+                    print(f"  {email} ({team_name})")
+    print(f"Bulk load finished in {time.perf_counter() - start:.1f}s.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk load CTFd users or teams straight into the database")
+    parser.add_argument("mode", choices=["users", "teams"], help="load users.csv or team_and_users.csv")
+    parser.add_argument("--csv", help="CSV file to load (default: the file of the matching add_*.py script)")
+    parser.add_argument("--database-url", default=DATABASE_URL,
+                        help=f"SQLAlchemy URL of the CTFd database (default: {DATABASE_URL})")
+    parser.add_argument("--processes", type=int, default=None,
+                        help="processes hashing passwords (default: one per CPU)")
+    parser.add_argument("--create-schema", action="store_true",
+                        help="create the CTFd tables first, e.g. for a test run on sqlite:///ctfd.db")
+    args = parser.parse_args()
+    main(args.mode, args.csv, args.database_url, args.processes, args.create_schema)
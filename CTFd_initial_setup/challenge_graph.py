@@ -0,0 +1,70 @@
+from collections import deque
+
+
+class PrerequisiteError(Exception):
+    """Raised when the challenge prerequisites in the CSV cannot be resolved"""
+
+
+def parse_prerequisites(row):
+    """Return the prerequisite challenge names of a CSV row"""
+    value = row.get("Challenge_Prerequisites") or ""
+    return [name.strip() for name in value.split("|") if name.strip()]
+
+
+def build_prerequisite_graph(rows):
+    """Build a name -> prerequisite names mapping from the challenge CSV rows.
+
+    Duplicate challenge names and prerequisites that do not name a challenge
+    of the CSV are reported together, before any API call is made.
+    """
+    graph, errors = {}, []
+    for row in rows:
+        name = row["Name"]
+        if name in graph:
+            errors.append(f"Duplicate challenge name '{name}'")
+            continue
+        graph[name] = parse_prerequisites(row)
+
+    for name, prerequisites in graph.items():
+        for prerequisite in prerequisites:
+            if prerequisite not in graph:
+                errors.append(f"Challenge '{name}' requires unknown challenge '{prerequisite}'")
+
+    if errors:
+        raise PrerequisiteError("\n".join(errors))
+    topological_order(graph)
+    return graph
+
+
+def dependents_of(graph):
+    """Invert the graph: name -> names of the challenges that require it"""
+    dependents = {name: [] for name in graph}
+    for name, prerequisites in graph.items():
+        for prerequisite in prerequisites:
+            dependents[prerequisite].append(name)
+    return dependents
+
+
+def topological_order(graph):
+    """Return the challenge names so that every challenge follows its prerequisites.
+
+    Uses Kahn's algorithm, starting from the challenges without prerequisites
+    in CSV order. Raises PrerequisiteError naming the challenges caught in a cycle.
+    """
+    remaining = {name: len(set(prerequisites)) for name, prerequisites in graph.items()}
+    dependents = dependents_of(graph)
+    ready = deque(name for name, count in remaining.items() if count == 0)
+    order = []
+
+    while ready:
+        name = ready.popleft()
+        order.append(name)
+        for dependent in set(dependents[name]):
+            remaining[dependent] -= 1
+            if remaining[dependent] == 0:
+                ready.append(dependent)
+
+    if len(order) != len(graph):
+        cycle = ", ".join(f"'{name}'" for name, count in remaining.items() if count > 0)
+        raise PrerequisiteError(f"Challenge prerequisites contain a cycle between {cycle}")
+    return order
@@ -1,75 +1,142 @@
-import requests
 import csv
 import os
 import sys
-import urllib3
-import time
+import json
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import requests
 
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+from ctfd_client import create_session, add_url_argument, add_pool_argument, default_url, default_pool_size
+from ctfd_state import fetch_all, fetch_challenge, fetch_challenge_state, find_challenge_file, changed_fields
+from uploads import MultipartFileStream, UploadLane, add_upload_arguments, default_upload_workers, default_cache_path
+from journal import Journal, open_journal, add_journal_arguments, default_journal_path
+from challenge_graph import PrerequisiteError, build_prerequisite_graph, dependents_of
+from instrumentation import progress, instrumented_run, add_instrumentation_arguments
 
 # Define API base URL
-api_url = "https://127.0.0.1/api/v1"
-token = sys.argv[1]
+api_url = f"{default_url}/api/v1"
 
-# CSV file path (Update this with your actual file path)
+# Default CSV file path, another one is given with --csv
 csv_file_path = "/home/ubuntu/ctfd_automation/csv_files/challenges.csv"
 
+# Number of challenges provisioned in parallel
+default_workers = 8
+
+# Journal scope of the payload every challenge was last created or patched with; kept across runs
+payloads_scope = "challenge payloads"
+
 # Define API endpoints
 file_upload_url = f"{api_url}/files"
 hint_url = f"{api_url}/hints"
 flag_url = f"{api_url}/flags"
 challenges_url = f"{api_url}/challenges"
 
+def use_ctfd_url(url):
+    """Point the API endpoints at the CTFd instance at ``url``"""
+    global api_url, file_upload_url, hint_url, flag_url, challenges_url
+    api_url = f"{url.rstrip('/')}/api/v1"
+    file_upload_url = f"{api_url}/files"
+    hint_url = f"{api_url}/hints"
+    flag_url = f"{api_url}/flags"
+    challenges_url = f"{api_url}/challenges"
+
 # Function to create challenge
-def create_challenge(challenge_data, headers):
-    response = requests.post(challenges_url, headers=headers, json=challenge_data, verify=False)
+def create_challenge(challenge_data, session):
+    response = session.post(challenges_url, json=challenge_data, verify=False)
     if response.status_code == 200:
         challenge_id = response.json()["data"]["id"]
-        print(f"Challenge '{challenge_data['name']}' created successfully with ID {challenge_id}.")
+        progress.ok("challenge", challenge_data['name'], id=challenge_id)
         return challenge_id
     else:
-        print(f"Unexpected response status: {response.status_code}")
-        print("Response text:", response.text)
+        progress.fail("challenge", challenge_data['name'], f"{response.status_code} - {response.text}")
         return None
 
 # Function to update challenge
-def update_challenge(challenge_id, update_data, headers):
+def update_challenge(challenge_id, update_data, session):
     update_url = f"{challenges_url}/{challenge_id}"
-    response = requests.patch(update_url, headers=headers, json=update_data, verify=False)
+    response = session.patch(update_url, json=update_data, verify=False)
     if response.status_code == 200:
-        print(f"Challenge '{challenge_id}' updated successfully.")
+        progress.ok("challenge update", challenge_id, fields=list(update_data))
+        return True
     else:
-        print(f"Failed to update challenge '{challenge_id}': {response.status_code}")
-        print("Response text:", response.text)
+        progress.fail("challenge update", challenge_id, f"{response.status_code} - {response.text}")
+        return False
+
+def sync_challenge(challenge_id, update_data, session, payloads, key, digest):
+    """Patch the changed fields, then record the payload the challenge matches from now on"""
+    if update_challenge(challenge_id, update_data, session) and payloads:
+        payloads.record(key, "payload", digest)
+
+def payload_digest(challenge_id, challenge_data):
+    """Fingerprint of a challenge payload, cut to fit the integer ID column of the journal"""
+    data = json.dumps([challenge_id, challenge_data], sort_keys=True).encode()
+    return int(hashlib.sha256(data).hexdigest()[:15], 16)
 
 # Function to upload a file
-def upload_file(file_path, challenge_id, headers):
+def upload_file(file_path, challenge_id, session, uploads=None, replace=False):
+    """Upload a file to a challenge unless the upload cache has this content for it.
+
+    With ``replace``, a file of the same name may already be on the
+    challenge without the cache knowing its content; it is uploaded again
+    and the live copy is removed.
+    """
     if not os.path.exists(file_path):
-        print(f"File {file_path} does not exist.")
+        progress.fail("file", file_path, "does not exist")
         return None
-    with open(file_path, 'rb') as f:
-        files = {'file': f}
-        data = {'challenge_id': challenge_id, 'type': 'challenge'}
-        response = requests.post(file_upload_url, headers=headers, files=files, data=data, verify=False)
-        if response.status_code == 200:
-            file_data = response.json()["data"][0]
-            print(f"File '{file_path}' uploaded and associated with challenge ID {challenge_id}.")
-            return file_data
-        else:
-            print(f"Failed to upload file '{file_path}': {response.status_code} - {response.text}")
+
+    # Skip files whose content was already uploaded to this challenge
+    digest = uploads.digests.get(file_path) if uploads else None
+    cached = uploads.cache.get(challenge_id, file_path) if uploads else None
+    if cached and cached["digest"] == digest:
+        progress.ok("file", file_path, challenge_id=challenge_id, cached=True)
+        return {"id": cached["file_id"]}
+    replaced = cached["file_id"] if cached else None
+    if replace and not replaced:
+        try:
+            replaced = find_challenge_file(session, api_url, challenge_id, file_path)
+        except requests.RequestException as e:
+            progress.fail("file", file_path, f"could not list the files of challenge {challenge_id}: {e}")
             return None
 
+    body = MultipartFileStream({'challenge_id': challenge_id, 'type': 'challenge'}, 'file', file_path)
+    try:
+        response = session.post(file_upload_url, data=body, headers={"Content-Type": body.content_type}, verify=False)
+    finally:
+        body.close()
+    if response.status_code == 200:
+        file_data = response.json()["data"][0]
+        progress.ok("file", file_path, challenge_id=challenge_id, id=file_data.get("id"))
+        if uploads:
+            uploads.cache.record(challenge_id, file_path, digest, file_data)
+        if replaced:
+            # The previous version of a changed file is replaced, not kept beside it
+            delete_file(replaced, session)
+        return file_data
+    else:
+        progress.fail("file", file_path, f"{response.status_code} - {response.text}")
+        return None
+
+def delete_file(file_id, session):
+    response = session.delete(f"{file_upload_url}/{file_id}", verify=False)
+    if response.status_code != 200:
+        progress.fail("file removal", file_id, f"{response.status_code} - {response.text}")
+
 # Function to add a flag
-def add_flag(challenge_id, content, flag_type, headers):
+def add_flag(challenge_id, content, flag_type, session):
     flag_data = {"challenge_id": challenge_id, "content": content, "type": flag_type}
-    response = requests.post(flag_url, headers=headers, json=flag_data, verify=False)
+    response = session.post(flag_url, json=flag_data, verify=False)
     if response.status_code == 200:
-        print(f"Successfully added flag to challenge ID {challenge_id}")
+        flag_id = response.json()["data"]["id"]
+        progress.ok("flag", challenge_id, id=flag_id)
+        return flag_id
     else:
-        print(f"Failed to add flag: {response.status_code} - {response.text}")
+        progress.fail("flag", challenge_id, f"{response.status_code} - {response.text}")
+        return None
 
 # Function to add a hint
-def add_hint(challenge_id, content, headers, cost=0, prerequisites=None):
+def add_hint(challenge_id, content, session, cost=0, prerequisites=None):
     # Set an empty array for prerequisites if none are provided
     hint_data = {
         "challenge_id": challenge_id,
@@ -77,99 +144,259 @@ def add_hint(challenge_id, content, headers, cost=0, prerequisites=None):
         "cost": cost,
         "requirements": {"prerequisites": prerequisites if prerequisites else []}
     }
-    response = requests.post(hint_url, headers=headers, json=hint_data, verify=False)    
+    response = session.post(hint_url, json=hint_data, verify=False)    
     if response.status_code == 200:
         hint_id = response.json()["data"]["id"]
-        print(f"Successfully added hint with ID {hint_id} to challenge ID {challenge_id}")
+        progress.ok("hint", challenge_id, id=hint_id)
         return hint_id
     else:
-        print(f"Failed to add hint: {response.status_code} - {response.text}")
+        progress.fail("hint", challenge_id, f"{response.status_code} - {response.text}")
         return None
 
-def update_hint(hint_id, prerequisites, headers):
+def update_hint(hint_id, update_data, session):
     hint_update_url = f"{hint_url}/{hint_id}"
-    # Set an empty array for prerequisites if none are provided
-    hint_data = {
-        "requirements": {"prerequisites": prerequisites if prerequisites else []}
-    }
-    response = requests.patch(hint_update_url, headers=headers, json=hint_data, verify=False)    
+    response = session.patch(hint_update_url, json=update_data, verify=False)
     if response.status_code == 200:
-        print(f"Successfully updated hint ID {hint_id} with prerequisites")
+        progress.ok("hint update", hint_id)
     else:
-        print(f"Failed to update hint ID {hint_id}: {response.status_code} - {response.text}")
-
-def main(token):
-    headers = {"Authorization": f"Bearer {token}"}
-    hint_ids, ch_dict = {}, {}
-    
-
-    with open(csv_file_path, mode='r') as file:
-        reader = csv.DictReader(file)
-        for row in reader:
-            challenge_type = row.get("Type", "standard")
-            challenge_data = {
-                "name": row["Name"],
-                "category": row["Category"],
-                "description": row["Description"],
-                "max_attempts": int(row["Max Attempts"]),
-                "state": row["State"],
-                "type": challenge_type,
-                "connection_info": row.get("Connection_Info", ""),
-                "value": int(row["Value"])
-            }
-
-            # Handle firstblood and dynamic challenges
-            if challenge_type == "firstblood":
-                first_blood_bonus = list(map(int, row["First_Blood_Bonus"].split("|")))
-                challenge_data.update({
-                    "first_blood_bonus[0]": first_blood_bonus[0],
-                    "first_blood_bonus[1]": first_blood_bonus[1],
-                    "first_blood_bonus[2]": first_blood_bonus[2]
-                })
-            elif challenge_type == "dynamic":
-                challenge_data["initial"] = int(row["Initial"])
-                challenge_data["decay"] = int(row["Decay"])
-                challenge_data["minimum"] = int(row["Minimum"])
-
-            hints = row["Hints"].split("|")
-            hints_cost = list(map(int, row["Hints_Cost"].split("|")))
-            challenge_prerequisites = list(row.get("Challenge_Prerequisites", "").split("|"))
-
-            challenge_id = create_challenge(challenge_data, headers)
-            if challenge_id:
-                file_path = row.get("File_Path")
-                if file_path:
-                    upload_file(file_path, challenge_id, headers)
-
-                flag_content = row.get("Flag")
-                flag_type = row.get("Flag_Type", "static")
-                if flag_content:
-                    add_flag(challenge_id, flag_content, flag_type, headers)
-
-                hint_ids[challenge_id] = []
-                for hint_content, hint_cost in zip(hints, hints_cost):
-                    hint_id = add_hint(challenge_id, hint_content, headers, hint_cost)
-                    if hint_id:
-                        hint_ids[challenge_id].append(hint_id)
-
-                for index, hint_id in enumerate(hint_ids[challenge_id]):
-                    prerequisites = [hid for hid in hint_ids[challenge_id][:index]]
-                    update_hint(hint_id, prerequisites, headers)
-
-                ch_dict[challenge_id] = [challenge_data["name"], challenge_prerequisites]
-                time.sleep(0.5)
-
-    # Resolve challenge prerequisites
-    for key in ch_dict.keys():
-        if ch_dict[key][1][0] != "":
-            for x in range(len(ch_dict[key][1])):
-                for k, value in ch_dict.items():
-                    if value[0] == ch_dict[key][1][x]:
-                        ch_dict[key][1][x] = k
-
-    for key in ch_dict.keys():
-        if ch_dict[key][1][0] != "":
-            update_challenge(key, {"requirements": {"prerequisites": ch_dict[key][1]}}, headers)
+        progress.fail("hint update", hint_id, f"{response.status_code} - {response.text}")
+
+def build_challenge_data(row):
+    """Build the challenge creation payload from a CSV row"""
+    challenge_type = row.get("Type", "standard")
+    challenge_data = {
+        "name": row["Name"],
+        "category": row["Category"],
+        "description": row["Description"],
+        "max_attempts": int(row["Max Attempts"]),
+        "state": row["State"],
+        "type": challenge_type,
+        "connection_info": row.get("Connection_Info", ""),
+        "value": int(row["Value"])
+    }
+
+    # Handle firstblood and dynamic challenges
+    if challenge_type == "firstblood":
+        first_blood_bonus = list(map(int, row["First_Blood_Bonus"].split("|")))
+        challenge_data.update({
+            "first_blood_bonus[0]": first_blood_bonus[0],
+            "first_blood_bonus[1]": first_blood_bonus[1],
+            "first_blood_bonus[2]": first_blood_bonus[2]
+        })
+    elif challenge_type == "dynamic":
+        challenge_data["initial"] = int(row["Initial"])
+        challenge_data["decay"] = int(row["Decay"])
+        challenge_data["minimum"] = int(row["Minimum"])
+
+    return challenge_data
+
+def run_step(journal, key, step, func, *args):
+    """Run an API step unless the journal has it as completed, then record the returned ID"""
+    if journal and journal.done(key, step):
+        return
+    result = func(*args)
+    if journal and result:
+        journal.record(key, step, result["id"] if isinstance(result, dict) else result)
+
+def add_hint_chain(challenge_id, hints, hints_cost, session, existing_hints=(), journal=None, key=None):
+    """Create the hints of a challenge in order, each one locked behind the previous ones.
+
+    The IDs of the earlier hints are known when a hint is created, so the
+    prerequisites go into the POST and no follow-up PATCH is needed. Hints
+    that already exist on the server (matched by position) are reused and
+    only patched when their cost changed, and hints recorded in the
+    journal are skipped.
+    """
+    hint_ids = []
+    for index, (hint_content, hint_cost) in enumerate(zip(hints, hints_cost)):
+        if index < len(existing_hints):
+            hint = existing_hints[index]
+            if hint.get("cost") != hint_cost:
+                update_hint(hint["id"], {"cost": hint_cost}, session)
+            hint_ids.append(hint["id"])
+            continue
+        hint_id = journal.get(key, f"hint{index}") if journal else None
+        if not hint_id:
+            hint_id = add_hint(challenge_id, hint_content, session, hint_cost, list(hint_ids))
+            if hint_id and journal:
+                journal.record(key, f"hint{index}", hint_id)
+        if hint_id:
+            hint_ids.append(hint_id)
+    return hint_ids
+
+def provision_challenge(row, session, step_pool, prerequisite_ids=None, state=None, journal=None, uploads=None,
+                        payloads=None):
+    """Create a challenge and run its file, flag and hint chain steps concurrently.
+
+    The steps only depend on the challenge ID, so they are submitted to
+    ``step_pool`` as soon as the challenge exists, and file uploads to the
+    separate ``uploads`` lane; a slow upload does not hold back the flag and
+    hint calls, and the hint chains of different challenges run side by side.
+
+    With a ``state`` of the live instance (sync mode), an existing challenge
+    is not created again: only changed fields, missing flags, hints and
+    files are sent. The list entry only shows name, category, type and
+    value, so the challenge itself is read only when these differ or when
+    its payload is not the one recorded in ``payloads`` at its last create
+    or patch. Files are compared by content through the upload cache.
+    Steps recorded in the ``journal`` by an interrupted run are not sent
+    again.
+    """
+    challenge_data = build_challenge_data(row)
+    if prerequisite_ids:
+        challenge_data["requirements"] = {"prerequisites": prerequisite_ids}
+    hints = row["Hints"].split("|")
+    hints_cost = list(map(int, row["Hints_Cost"].split("|")))
+
+    steps = []
+    key = challenge_data["name"]
+    # Prerequisites removed from the CSV are removed on CTFd too
+    desired = {**challenge_data, "requirements": {"prerequisites": sorted(prerequisite_ids or [])}}
+    existing = state.challenges.get(key) if state else None
+    if existing:
+        challenge_id = existing["id"]
+        digest = payload_digest(challenge_id, desired)
+        changes = changed_fields(desired, existing)
+        if challenge_data["type"] == "dynamic":
+            changes.pop("value", None)  # The live value of a dynamic challenge decays with solves
+        if changes or not payloads or payloads.get(key, "payload") != digest:
+            try:
+                live = fetch_challenge(session, api_url, challenge_id)
+            except requests.RequestException as e:
+                progress.fail("challenge update", challenge_id, f"could not read the live challenge: {e}")
+                live = None
+            if live:
+                changes = changed_fields(desired, live)
+                if challenge_data["type"] == "dynamic":
+                    changes.pop("value", None)
+                if changes:
+                    steps.append(step_pool.submit(sync_challenge, challenge_id, changes, session, payloads, key,
+                                                  digest))
+                elif payloads:
+                    payloads.record(key, "payload", digest)
+    elif journal and journal.get(key, "challenge"):
+        challenge_id = journal.get(key, "challenge")
+    else:
+        challenge_id = create_challenge(challenge_data, session)
+        if not challenge_id:
+            return None
+        if journal:
+            journal.record(key, "challenge", challenge_id)
+        if payloads:
+            payloads.record(key, "payload", payload_digest(challenge_id, desired))
+
+    file_paths = [path for path in (row.get("File_Path") or "").split("|") if path]
+    for index, file_path in enumerate(file_paths):
+        # A file of that name may be on the challenge already, but only its cached digest tells its content
+        replace = bool(existing) and state.has_file(challenge_id, file_path)
+        lane = uploads or step_pool
+        steps.append(lane.submit(run_step, journal, key, f"file{index}",
+                                 upload_file, file_path, challenge_id, session, uploads, replace))
+
+    flag_content = row.get("Flag")
+    flag_type = row.get("Flag_Type", "static")
+    if flag_content and not (existing and flag_content in state.flags[challenge_id]):
+        steps.append(step_pool.submit(run_step, journal, key, "flag",
+                                      add_flag, challenge_id, flag_content, flag_type, session))
+
+    existing_hints = state.hints[challenge_id] if existing else ()
+    if len(existing_hints) < len(hints) or any(h.get("cost") != c for h, c in zip(existing_hints, hints_cost)):
+        steps.append(step_pool.submit(add_hint_chain, challenge_id, hints, hints_cost, session,
+                                      existing_hints, journal, key))
+    # The challenge exists whatever happens to one of its steps, so its dependents are still provisioned
+    for f in steps:
+        try:
+            f.result()
+        except Exception as e:
+            progress.fail("challenge step", key, e)
+    return challenge_id
+
+def main(token, workers=default_workers, pool_size=default_pool_size, sync=False,
+         journal_path=default_journal_path, resume=False,
+         upload_workers=default_upload_workers, upload_cache=default_cache_path, url=default_url,
+         csv_path=csv_file_path):
+    use_ctfd_url(url)
+    with open(csv_path, mode='r') as file:
+        rows = list(csv.DictReader(file))
+
+    # Validate prerequisites before any network call
+    try:
+        graph = build_prerequisite_graph(rows)
+    except PrerequisiteError as e:
+        print(f"Invalid challenge prerequisites:\n{e}")
+        sys.exit(1)
+
+    session = create_session(token, pool_size)
+    journal = open_journal(journal_path, "challenges", resume, sync)
+    payloads = Journal(journal_path, payloads_scope)
+    rows_by_name = {row["Name"]: row for row in rows}
+    dependents = dependents_of(graph)
+    remaining = {name: len(set(prerequisites)) for name, prerequisites in graph.items()}
+    challenge_ids = {}
+
+    # Sync mode diffs the CSV against the live instance instead of assuming it is empty
+    state = fetch_challenge_state(session, api_url) if sync else None
+    if state:
+        print(f"Found {len(state.challenges)} existing challenges.")
+
+    # Challenges are submitted as soon as all their prerequisites exist, so the
+    # requirements are part of the create call and no PATCH pass is needed.
+    # Challenge workers block on their own steps, so steps get a separate pool.
+    with ThreadPoolExecutor(max_workers=workers) as challenge_pool, \
+            ThreadPoolExecutor(max_workers=workers * 4) as step_pool, \
+            UploadLane(upload_workers, upload_cache) as uploads:
+
+        # Forget cached uploads that no longer exist, e.g. after a redeploy
+        if uploads.cache.entries:
+            stale = uploads.cache.prune(fetch_all(session, f"{api_url}/files", {"type": "challenge"}))
+            if stale:
+                print(f"Dropped {stale} stale entries from the upload cache.")
+
+        def submit(name):
+            prerequisite_ids = [challenge_ids[prerequisite] for prerequisite in graph[name]]
+            return challenge_pool.submit(provision_challenge, rows_by_name[name], session, step_pool,
+                                       prerequisite_ids, state, journal, uploads, payloads)
+
+        running = {submit(name): name for name in graph if remaining[name] == 0}
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                # One failing challenge must not abort the others; its dependents are skipped below
+                try:
+                    challenge_id = future.result()
+                except Exception as e:
+                    progress.fail("challenge", name, e)
+                    challenge_id = None
+                if not challenge_id:
+                    continue
+                challenge_ids[name] = challenge_id
+                for dependent in set(dependents[name]):
+                    remaining[dependent] -= 1
+                    if remaining[dependent] == 0:
+                        running[submit(dependent)] = dependent
+
+    # Never create a challenge without the prerequisites it should be locked behind
+    for name in graph:
+        if name not in challenge_ids and remaining[name] > 0:
+            progress.fail("challenge", name, "skipped, a prerequisite challenge was not created")
+    journal.close()
+    payloads.close()
 
 if __name__ == "__main__":
-    main(token)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Create CTFd challenges from a CSV file")
+    parser.add_argument("token", help="CTFd admin API token")
+    parser.add_argument("--workers", type=int, default=default_workers,
+                        help=f"number of challenges provisioned in parallel (default: {default_workers})")
+    parser.add_argument("--sync", action="store_true",
+                        help="only create or update what differs from the challenges already on CTFd")
+    parser.add_argument("--csv", default=csv_file_path, help=f"challenges CSV file (default: {csv_file_path})")
+    add_url_argument(parser)
+    add_pool_argument(parser)
+    add_journal_arguments(parser)
+    add_upload_arguments(parser)
+    add_instrumentation_arguments(parser)
+    args = parser.parse_args()
+    with instrumented_run(args.metrics, args.trace, args.progress_interval, args.progress_log):
+        main(args.token, args.workers, args.pool_size, args.sync, args.journal, args.resume,
+             args.upload_workers, args.upload_cache, args.url, args.csv)
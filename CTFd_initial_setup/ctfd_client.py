@@ -0,0 +1,115 @@
+import ssl
+import time
+import random
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+from urllib3.util.ssl_ import create_urllib3_context
+
+from instrumentation import InstrumentedSession
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+# Maximum number of keep-alive connections kept open to the CTFd host
+default_pool_size = 32
+
+# CTFd instance the provisioning scripts talk to
+default_url = "https://127.0.0.1"
+
+
+class PooledAdapter(HTTPAdapter):
+    """HTTP adapter whose connections all share a single TLS context.
+
+    Connections are kept alive and reused by every thread using the session,
+    so the TCP and TLS handshakes are paid once per pooled connection instead
+    of once per API call.
+    """
+
+    def __init__(self, ssl_context, **kwargs):
+        self.ssl_context = ssl_context
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs["ssl_context"] = self.ssl_context
+        return super().init_poolmanager(*args, **kwargs)
+
+    def proxy_manager_for(self, *args, **kwargs):
+        kwargs["ssl_context"] = self.ssl_context
+        return super().proxy_manager_for(*args, **kwargs)
+
+
+def create_pooled_session(pool_size=default_pool_size):
+    """Create a session that reuses up to ``pool_size`` keep-alive connections per host"""
+    # The servers use self-signed certificates, requests still pass verify=False
+    ssl_context = create_urllib3_context()
+    ssl_context.check_hostname = False
+    ssl_context.verify_mode = ssl.CERT_NONE
+
+    # pool_block makes extra threads wait for a free connection instead of
+    # opening throwaway connections that are closed after a single request
+    adapter = PooledAdapter(ssl_context, pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+
+    # Every call is recorded per endpoint, see instrumentation.py
+    session = InstrumentedSession()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({"Connection": "keep-alive"})
+    return session
+
+
+def create_session(token, pool_size=default_pool_size):
+    """Create a CTFd API session with connection pooling and token auth"""
+    session = create_pooled_session(pool_size)
+    # CTFd only honours a token on requests sent as JSON, GET and DELETE included;
+    # multipart uploads replace the content type with their own
+    session.headers.update({"Authorization": f"Token {token}", "Content-Type": "application/json"})
+    return session
+
+
+def add_url_argument(parser):
+    """Add the --url option shared by the provisioning scripts"""
+    parser.add_argument("--url", default=default_url, help=f"CTFd URL (default: {default_url})")
+
+
+def add_pool_argument(parser):
+    """Add the --pool-size option shared by the provisioning scripts"""
+    parser.add_argument("--pool-size", type=int, default=default_pool_size,
+                        help=f"maximum number of pooled keep-alive connections (default: {default_pool_size})")
+
+
+# Responses worth retrying: rate limiting and gateway/server errors
+retry_status_codes = {429, 500, 502, 503, 504}
+default_retries = 5
+default_backoff = 0.5
+
+
+def request_with_retry(session, method, url, retries=default_retries, backoff=default_backoff, **kwargs):
+    """Send a request, retrying 429/5xx responses and connection errors.
+
+    Waits use exponential backoff with full jitter, or the server's
+    Retry-After header when it sends one. The last response is returned
+    (or the last connection error raised) once the retries are used up;
+    its ``attempts`` attribute tells how many requests were sent.
+    """
+    for attempt in range(retries + 1):
+        try:
+            response = session.request(method, url, **kwargs)
+        except requests.ConnectionError:
+            if attempt == retries:
+                raise
+        else:
+            response.attempts = attempt + 1
+            if response.status_code not in retry_status_codes or attempt == retries:
+                return response
+            retry_after = response.headers.get("Retry-After", "")
+            if retry_after.isdigit():
+                time.sleep(int(retry_after))
+                continue
+        time.sleep(random.uniform(0, backoff * 2 ** attempt))
+
+
+def add_retry_arguments(parser):
+    """Add the --retries and --backoff options shared by the provisioning scripts"""
+    parser.add_argument("--retries", type=int, default=default_retries,
+                        help=f"retries for 429/5xx responses and connection errors (default: {default_retries})")
+    parser.add_argument("--backoff", type=float, default=default_backoff,
+                        help=f"base delay in seconds of the exponential backoff (default: {default_backoff})")
@@ -5,16 +5,17 @@ import urllib3
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 # Get the user mode and admin credentials from the command line arguments
-if len(sys.argv) != 5:
-    print("Usage: python3 ctfd_setup.py <user_mode> <admin_username> <admin_email> <admin_password>")
+if len(sys.argv) not in (5, 6):
+    print("Usage: python3 ctfd_setup.py <user_mode> <admin_username> <admin_email> <admin_password> [ctfd_url]")
     sys.exit(1)
 
 user_mode = sys.argv[1]
 admin_username = sys.argv[2]
 admin_email = sys.argv[3]
 admin_password = sys.argv[4]
+ctfd_url = sys.argv[5].rstrip('/') if len(sys.argv) == 6 else 'https://127.0.0.1'
 
-setup_page_url = f'https://127.0.0.1/setup'
+setup_page_url = f'{ctfd_url}/setup'
 
 # Create a session to persist cookies
 session = requests.Session()
@@ -34,7 +35,7 @@ else:
     sys.exit(1)
 
 # Step 2: Perform the setup using the CSRF token
-setup_url = f'https://127.0.0.1/setup'
+setup_url = f'{ctfd_url}/setup'
 setup_data = {
     'ctf_name': 'CTFd',
     'ctf_description': 'CTFd description',
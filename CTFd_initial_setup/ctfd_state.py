@@ -0,0 +1,105 @@
+import os
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from ctfd_client import request_with_retry
+
+# Largest page size CTFd accepts on paginated list endpoints
+page_size = 100
+
+
+def fetch_all(session, url, params=None):
+    """GET every page of a CTFd list endpoint and return the combined data"""
+    items, page = [], 1
+    while page:
+        r = request_with_retry(session, "GET", url, params={**(params or {}), "page": page, "per_page": page_size},
+                               verify=False)
+        r.raise_for_status()
+        body = r.json()
+        items.extend(body["data"])
+        # Unpaginated endpoints (challenges, flags, hints) have no pagination meta
+        page = ((body.get("meta") or {}).get("pagination") or {}).get("next")
+    return items
+
+
+def fetch_challenge(session, api_url, challenge_id):
+    """One challenge as sync compares it: the list leaves out description, state, max_attempts,
+    connection_info and the dynamic settings, and requirements have their own endpoint"""
+    r = request_with_retry(session, "GET", f"{api_url}/challenges/{challenge_id}", verify=False)
+    r.raise_for_status()
+    challenge = r.json()["data"]
+    r = request_with_retry(session, "GET", f"{api_url}/challenges/{challenge_id}/requirements", verify=False)
+    r.raise_for_status()
+    challenge["requirements"] = {"prerequisites": sorted((r.json()["data"] or {}).get("prerequisites") or [])}
+    return challenge
+
+
+def find_challenge_file(session, api_url, challenge_id, file_path):
+    """ID of the file named like ``file_path`` on a challenge, or None"""
+    r = request_with_retry(session, "GET", f"{api_url}/challenges/{challenge_id}/files", verify=False)
+    r.raise_for_status()
+    name = os.path.basename(file_path)
+    return next((f["id"] for f in r.json()["data"] if os.path.basename(f["location"]) == name), None)
+
+
+def changed_fields(payload, existing):
+    """Return the payload fields whose value differs from the live object"""
+    return {key: value for key, value in payload.items() if key in existing and existing[key] != value}
+
+
+class ChallengeState:
+    """Challenges, flags, hints and files already on the CTFd instance"""
+
+    def __init__(self, challenges, flags, hints, files):
+        self.challenges = {c["name"]: c for c in challenges}
+        self.flags = defaultdict(set)
+        for flag in flags:
+            self.flags[flag["challenge_id"]].add(flag["content"])
+        # The hint list does not expose hint content, so hints are matched by position
+        self.hints = defaultdict(list)
+        for hint in sorted(hints, key=lambda h: h["id"]):
+            self.hints[hint.get("challenge_id", hint.get("challenge"))].append(hint)
+        self.files = set()
+        for f in files:
+            self.files.add((f.get("challenge_id"), os.path.basename(f["location"])))
+
+    def has_file(self, challenge_id, file_path):
+        name = os.path.basename(file_path)
+        return (challenge_id, name) in self.files or (None, name) in self.files
+
+
+def fetch_challenge_state(session, api_url):
+    """Fetch the existing challenges, flags, hints and challenge files with one GET each"""
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        challenges = pool.submit(fetch_all, session, f"{api_url}/challenges", {"view": "admin"})
+        flags = pool.submit(fetch_all, session, f"{api_url}/flags")
+        hints = pool.submit(fetch_all, session, f"{api_url}/hints")
+        files = pool.submit(fetch_all, session, f"{api_url}/files", {"type": "challenge"})
+        return ChallengeState(challenges.result(), flags.result(), hints.result(), files.result())
+
+
+def find_user(session, base_url, email):
+    """ID of the user registered with ``email``, found with the admin user search, or None"""
+    r = request_with_retry(session, "GET", f"{base_url}/api/v1/users",
+                           params={"view": "admin", "field": "email", "q": email}, verify=False)
+    r.raise_for_status()
+    return next((u["id"] for u in r.json()["data"] if (u.get("email") or "").lower() == email.lower()), None)
+
+
+class AccountState:
+    """Users (by email) and teams (by name) already on the CTFd instance"""
+
+    def __init__(self, users, teams):
+        self.users = {u["email"].lower(): u for u in users if u.get("email")}
+        self.teams = {t["name"]: t for t in teams}
+
+    def user(self, email):
+        return self.users.get(email.lower())
+
+
+def fetch_account_state(session, base_url, teams=False):
+    """Fetch the existing users, and teams when running in team mode"""
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        users = pool.submit(fetch_all, session, f"{base_url}/api/v1/users", {"view": "admin"})
+        team_list = pool.submit(fetch_all, session, f"{base_url}/api/v1/teams", {"view": "admin"}) if teams else None
+        return AccountState(users.result(), team_list.result() if team_list else [])
@@ -0,0 +1,270 @@
+import os
+import csv
+import sys
+import json
+import shutil
+import hashlib
+import argparse
+import zipfile
+from datetime import datetime, timezone
+
+from challenge_graph import PrerequisiteError, build_prerequisite_graph, parse_prerequisites
+from passwords import hash_passwords
+from rosters import read_users, read_teams
+
+# Challenge CSV, the same one challenges.py reads
+challenges_csv_path = "/home/ubuntu/ctfd_automation/csv_files/challenges.csv"
+
+# Tables written by the builder; every other table of the base export is kept as is
+built_tables = ("challenges", "dynamic_challenge", "first_blood_challenge", "flags", "hints", "files",
+                "users", "teams")
+
+
+def load_tables(base):
+    """Read the db/*.json tables of a CTFd export into {table name: rows}"""
+    tables = {}
+    for name in base.namelist():
+        if name.startswith("db/") and name.endswith(".json"):
+            data = base.read(name)
+            tables[name[3:-5]] = json.loads(data)["results"] if data else []
+    return tables
+
+
+class IdSequence:
+    """Hands out the IDs following the largest one already in a table"""
+
+    def __init__(self, rows):
+        self.last = max((row["id"] for row in rows), default=0)
+
+    def next(self):
+        self.last += 1
+        return self.last
+
+
+def sha1_of(file_path):
+    sha1 = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def file_location(challenge_id, sha1sum, file_path):
+    """Upload location of a challenge file, derived from its content so that builds are repeatable"""
+    token = hashlib.sha256(f"{challenge_id}/{sha1sum}".encode()).hexdigest()[:32]
+    return f"{token}/{os.path.basename(file_path)}"
+
+
+def add_challenges(tables, rows):
+    """Append the challenges of the CSV with their flags, hints and files.
+
+    Challenges whose name is already in the base export are left out.
+    Returns the (archive member, local path) pairs of the files to store.
+    """
+    for name in ("challenges", "dynamic_challenge", "first_blood_challenge", "flags", "hints", "files"):
+        tables.setdefault(name, [])
+    existing = {c["name"]: c["id"] for c in tables["challenges"]}
+    challenge_ids, flag_ids, hint_ids, file_ids = (IdSequence(tables[name]) for name in
+                                                   ("challenges", "flags", "hints", "files"))
+
+    # IDs are assigned first so prerequisites can refer to any challenge of the CSV
+    new_rows = [row for row in rows if row["Name"] not in existing]
+    ids = dict(existing)
+    for row in new_rows:
+        ids[row["Name"]] = challenge_ids.next()
+
+    uploads = []
+    for row in new_rows:
+        challenge_id = ids[row["Name"]]
+        challenge_type = row.get("Type", "standard")
+        prerequisites = [ids[name] for name in parse_prerequisites(row)]
+        tables["challenges"].append({
+            "id": challenge_id,
+            "name": row["Name"],
+            "description": row["Description"],
+            "connection_info": row.get("Connection_Info", ""),
+            "max_attempts": int(row["Max Attempts"]),
+            "value": int(row["Initial"]) if challenge_type == "dynamic" else int(row["Value"]),
+            "category": row["Category"],
+            "type": challenge_type,
+            "state": row["State"],
+            "requirements": {"prerequisites": prerequisites} if prerequisites else None,
+        })
+        if challenge_type == "dynamic":
+            tables["dynamic_challenge"].append({
+                "id": challenge_id, "initial": int(row["Initial"]), "decay": int(row["Decay"]),
+                "minimum": int(row["Minimum"]),
+            })
+        elif challenge_type == "firstblood":
+            tables["first_blood_challenge"].append({
+                "id": challenge_id, "first_blood_bonus": list(map(int, row["First_Blood_Bonus"].split("|"))),
+            })
+
+        if row.get("Flag"):
+            tables["flags"].append({
+                "id": flag_ids.next(), "challenge_id": challenge_id, "type": row.get("Flag_Type", "static"),
+                "content": row["Flag"], "data": "",
+            })
+
+        # Each hint is locked behind the previous ones, as challenges.py creates them
+        chain = []
+        for content, cost in zip(row["Hints"].split("|"), map(int, row["Hints_Cost"].split("|"))):
+            hint_id = hint_ids.next()
+            tables["hints"].append({
+                "id": hint_id, "type": "standard", "challenge_id": challenge_id, "content": content, "cost": cost,
+                "requirements": {"prerequisites": list(chain)},
+            })
+            chain.append(hint_id)
+
+        for file_path in (path for path in (row.get("File_Path") or "").split("|") if path):
+            if not os.path.exists(file_path):
+                print(f"File {file_path} does not exist.")
+                continue
+            sha1sum = sha1_of(file_path)
+            location = file_location(challenge_id, sha1sum, file_path)
+            tables["files"].append({
+                "id": file_ids.next(), "type": "challenge", "location": location, "challenge_id": challenge_id,
+                "sha1sum": sha1sum,
+            })
+            uploads.append((f"uploads/{location}", file_path))
+
+    print(f"{len(new_rows)} challenges added, {len(rows) - len(new_rows)} already in the base export.")
+    return uploads
+
+
+def add_accounts(tables, users, teams=(), processes=None, created=None):
+    """Append users and teams, skipping emails and team names of the base export.
+
+    Passwords are hashed here, as CTFd stores them, in a process pool.
+    Accounts get ``created`` (a UTC datetime, default now) as creation time.
+    """
+    tables.setdefault("users", [])
+    tables.setdefault("teams", [])
+    emails = {u["email"].lower() for u in tables["users"] if u.get("email")}
+    names = {u["name"] for u in tables["users"]}
+    team_names = {t["name"] for t in tables["teams"]}
+
+    memberships = [(team, member) for team in teams for member in team["members"]]
+    new_users = []
+    for user in list(users) + [member for _, member in memberships]:
+        if user["email"].lower() in emails or user["name"] in names:
+            continue
+        emails.add(user["email"].lower())
+        names.add(user["name"])
+        new_users.append(user)
+    new_teams = [team for team in teams if team["name"] not in team_names]
+
+    hashes = hash_passwords([u["password"] for u in new_users] + [t["password"] for t in new_teams], processes)
+    # CTFd stores naive UTC timestamps
+    created = (created or datetime.now(timezone.utc)).replace(tzinfo=None).isoformat()
+
+    user_ids, team_ids = IdSequence(tables["users"]), IdSequence(tables["teams"])
+    by_email = {}
+    for user, hashed in zip(new_users, hashes):
+        row = {
+            "id": user_ids.next(), "name": user["name"], "email": user["email"], "password": hashed,
+            "type": "user", "verified": True, "hidden": False, "banned": False, "team_id": None, "created": created,
+        }
+        tables["users"].append(row)
+        by_email[user["email"].lower()] = row
+
+    by_name = {}
+    for team, hashed in zip(new_teams, hashes[len(new_users):]):
+        row = {
+            "id": team_ids.next(), "name": team["name"], "password": hashed, "hidden": False, "banned": False,
+            "captain_id": None, "created": created,
+        }
+        tables["teams"].append(row)
+        by_name[team["name"]] = row
+
+    # Only accounts created by this export join a team; the first member is captain
+    linked = 0
+    for team, member in memberships:
+        team_row, user_row = by_name.get(team["name"]), by_email.get(member["email"].lower())
+        if team_row and user_row and user_row["team_id"] is None:
+            user_row["team_id"] = team_row["id"]
+            if team_row["captain_id"] is None:
+                team_row["captain_id"] = user_row["id"]
+            linked += 1
+
+    print(f"{len(new_users)} users, {len(new_teams)} teams and {linked} memberships added.")
+
+
+def archive_member(name, created):
+    """Archive entry dated ``created`` rather than now, so the same input gives the same archive"""
+    info = zipfile.ZipInfo(name, created.timetuple()[:6])
+    info.compress_type = zipfile.ZIP_DEFLATED
+    info.external_attr = 0o644 << 16
+    return info
+
+
+def write_export(base, tables, uploads, output_path, created=None):
+    """Write the export: base members are copied, built tables and files streamed into the archive"""
+    created = created or datetime.now(timezone.utc)
+    with zipfile.ZipFile(output_path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for info in base.infolist():
+            table = info.filename[3:-5] if info.filename.startswith("db/") else None
+            if table in tables:
+                continue
+            member = zipfile.ZipInfo(info.filename, info.date_time)
+            member.compress_type, member.external_attr = zipfile.ZIP_DEFLATED, info.external_attr
+            with base.open(info) as source, archive.open(member, 'w') as target:
+                shutil.copyfileobj(source, target)
+        for name, rows in tables.items():
+            archive.writestr(archive_member(f"db/{name}.json", created),
+                             json.dumps({"count": len(rows), "results": rows, "meta": {}}, default=str))
+        for member, file_path in uploads:
+            with open(file_path, 'rb') as source, archive.open(archive_member(member, created), 'w') as target:
+                shutil.copyfileobj(source, target)
+
+
+def main(base_path, output_path, challenges_csv=None, users_csv=None, teams_csv=None, processes=None,
+         created=None):
+    created = created or datetime.now(timezone.utc)
+    base = zipfile.ZipFile(base_path)
+    if "db/alembic_version.json" not in base.namelist():
+        print(f"{base_path} is not a CTFd export.")
+        sys.exit(1)
+    tables = load_tables(base)
+    base_tables = set(tables)
+
+    uploads = []
+    if challenges_csv:
+        with open(challenges_csv, mode='r') as file:
+            rows = list(csv.DictReader(file))
+        try:
+            build_prerequisite_graph(rows)
+        except PrerequisiteError as e:
+            print(f"Invalid challenge prerequisites:\n{e}")
+            sys.exit(1)
+        uploads = add_challenges(tables, rows)
+
+    if users_csv or teams_csv:
+        add_accounts(tables, read_users(users_csv) if users_csv else [], read_teams(teams_csv) if teams_csv else [],
+                     processes, created)
+
+    # Empty plugin tables are only written when the base instance has them
+    built = {name: rows for name, rows in tables.items() if name in built_tables and (rows or name in base_tables)}
+    write_export(base, built, uploads, output_path, created)
+    base.close()
+    print(f"Export written to {output_path}.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a CTFd export archive from the CSV files, offline")
+    parser.add_argument("base", help="export of the freshly set up CTFd instance (Admin Panel > Config > Backup)")
+    parser.add_argument("output", help="export archive to write")
+    parser.add_argument("--challenges", nargs="?", const=challenges_csv_path,
+                        help=f"add the challenges of this CSV (default: {challenges_csv_path})")
+    parser.add_argument("--users", help="add the users of this CSV (users.csv format)")
+    parser.add_argument("--teams", help="add the teams and members of this CSV (team_and_users.csv format)")
+    parser.add_argument("--processes", type=int, default=None,
+                        help="processes hashing passwords (default: one per CPU)")
+    parser.add_argument("--created", type=datetime.fromisoformat,
+                        help="creation time of the accounts and archive entries, e.g. 2024-05-01T09:00:00+00:00, "
+                             "so rebuilding from the same input gives the same archive (default: now)")
+    args = parser.parse_args()
+    created = args.created
+    if created and created.tzinfo:
+        created = created.astimezone(timezone.utc)
+    main(args.base, args.output, args.challenges, args.users, args.teams, args.processes, created)
@@ -0,0 +1,252 @@
+import re
+import json
+import time
+import bisect
+import threading
+import contextlib
+from collections import Counter
+
+import requests
+
+# Upper bounds of the latency histogram buckets, in milliseconds; slower calls land in a last open bucket
+latency_buckets_ms = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# Seconds between two progress lines
+default_progress_interval = 5.0
+
+
+def endpoint_of(url):
+    """Path of a URL with object IDs and UUIDs collapsed, so calls are grouped per endpoint"""
+    path = re.sub(r"^\w+://[^/]+", "", url).split("?")[0]
+    path = re.sub(r"/[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}(?=/|$)", "/{uuid}", path)
+    return re.sub(r"/\d+(?=/|$)", "/{id}", path)
+
+
+class EndpointStats:
+    """Calls of one method and endpoint: count, bytes, statuses and a latency histogram"""
+
+    def __init__(self):
+        self.count = 0
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.statuses = Counter()
+        self.buckets = [0] * (len(latency_buckets_ms) + 1)
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def add(self, status, request_bytes, response_bytes, ms):
+        self.count += 1
+        self.request_bytes += request_bytes
+        self.response_bytes += response_bytes
+        self.statuses[str(status)] += 1
+        self.buckets[bisect.bisect_left(latency_buckets_ms, ms)] += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def percentile(self, p):
+        """Upper bound of the bucket holding the p-th percentile, the maximum for the last bucket"""
+        rank = p / 100 * self.count
+        seen = 0
+        for bound, count in zip(latency_buckets_ms, self.buckets):
+            seen += count
+            if seen >= rank:
+                return min(bound, round(self.max_ms, 2))
+        return round(self.max_ms, 2)
+
+    def summary(self):
+        histogram = {f"<={bound}": count for bound, count in zip(latency_buckets_ms, self.buckets) if count}
+        if self.buckets[-1]:
+            histogram[f">{latency_buckets_ms[-1]}"] = self.buckets[-1]
+        return {
+            "count": self.count,
+            "request_bytes": self.request_bytes,
+            "response_bytes": self.response_bytes,
+            "statuses": dict(sorted(self.statuses.items())),
+            "latency_ms": {
+                "mean": round(self.total_ms / self.count, 2) if self.count else 0.0,
+                "p50": self.percentile(50),
+                "p95": self.percentile(95),
+                "p99": self.percentile(99),
+                "max": round(self.max_ms, 2),
+                "histogram": histogram,
+            },
+        }
+
+
+class Collector:
+    """Per-endpoint statistics of every HTTP call of a run, and optionally a timeline of them.
+
+    Recording is a lock and a few counters per call; timeline events are only
+    kept when ``trace`` is set.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self, trace=False):
+        with self.lock:
+            self.endpoints = {}
+            self.trace = trace
+            self.events = []
+            self.threads = {}
+            self.started = time.perf_counter()
+
+    def record(self, method, url, status, request_bytes, response_bytes, start, end):
+        key = f"{method} {endpoint_of(url)}"
+        with self.lock:
+            stats = self.endpoints.get(key)
+            if stats is None:
+                stats = self.endpoints[key] = EndpointStats()
+            stats.add(status, request_bytes, response_bytes, (end - start) * 1000)
+            if self.trace:
+                thread = threading.current_thread()
+                self.threads.setdefault(thread.ident, thread.name)
+                self.events.append({"name": key, "cat": "http", "ph": "X", "pid": 1, "tid": thread.ident,
+                                    "ts": round((start - self.started) * 1e6), "dur": round((end - start) * 1e6),
+                                    "args": {"status": status}})
+
+    def summary(self):
+        with self.lock:
+            return {key: stats.summary() for key, stats in
+                    sorted(self.endpoints.items(), key=lambda item: -item[1].total_ms)}
+
+    def chrome_trace(self):
+        """Trace Event Format, for chrome://tracing or https://ui.perfetto.dev"""
+        with self.lock:
+            names = [{"name": "thread_name", "ph": "M", "pid": 1, "tid": ident, "args": {"name": name}}
+                     for ident, name in self.threads.items()]
+            return {"traceEvents": names + self.events, "displayTimeUnit": "ms"}
+
+    def print_summary(self, file=None):
+        summary = self.summary()
+        if not summary:
+            return
+        print(f"\n{'endpoint':<52} {'calls':>7} {'errors':>7} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}", file=file)
+        for key, stats in summary.items():
+            errors = sum(count for status, count in stats["statuses"].items() if not status.startswith("2"))
+            latency = stats["latency_ms"]
+            print(f"{key:<52} {stats['count']:>7} {errors:>7} {latency['p50']:>8.0f} {latency['p95']:>8.0f} "
+                  f"{latency['max']:>8.0f}", file=file)
+
+
+# Shared by every session of the process
+collector = Collector()
+
+
+def body_length(request):
+    return int(request.headers.get("Content-Length") or 0) if request is not None else 0
+
+
+class InstrumentedSession(requests.Session):
+    """A session recording every call, retries included, in the shared collector"""
+
+    def request(self, method, url, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = super().request(method, url, *args, **kwargs)
+        except requests.RequestException as e:
+            collector.record(method, url, type(e).__name__, body_length(e.request), 0, start, time.perf_counter())
+            raise
+        collector.record(method, url, response.status_code, body_length(response.request),
+                         len(response.content or b""), start, time.perf_counter())
+        return response
+
+
+class Progress:
+    """Outcome of every row of a run, counted instead of printed line by line.
+
+    Failures are printed as they happen; successes only show up in a status
+    line every ``interval`` seconds and in the final totals. With a log
+    file, every event is also written to it as one JSON line.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stop = None
+        self.log = None
+        self.counts = {}
+        self.started = time.perf_counter()
+
+    def start(self, interval=default_progress_interval, log_path=None):
+        self.counts = {}
+        self.started = time.perf_counter()
+        self.log = open(log_path, 'w') if log_path else None
+        if interval:
+            self.stop = threading.Event()
+            threading.Thread(target=self._report, args=(self.stop, interval), daemon=True).start()
+        return self
+
+    def _report(self, stop, interval):
+        while not stop.wait(interval):
+            print(self.status(), flush=True)
+
+    def event(self, kind, key, ok=True, **fields):
+        with self.lock:
+            counts = self.counts.setdefault(kind, Counter())
+            counts["ok" if ok else "failed"] += 1
+            if self.log:
+                self.log.write(json.dumps({"t": round(time.perf_counter() - self.started, 3), "kind": kind,
+                                           "key": key, "ok": ok, **fields}, default=str) + "\n")
+
+    def ok(self, kind, key, **fields):
+        self.event(kind, key, True, **fields)
+
+    def fail(self, kind, key, error):
+        self.event(kind, key, False, error=error)
+        print(f"Failed {kind} {key}: {error}", flush=True)
+
+    def status(self):
+        elapsed = time.perf_counter() - self.started
+        with self.lock:
+            parts = [f"{kind}: {counts['ok']} ok" + (f", {counts['failed']} failed" if counts["failed"] else "")
+                     + f" ({counts['ok'] / elapsed if elapsed else 0:.1f}/sec)"
+                     for kind, counts in self.counts.items()]
+        return f"[{elapsed:6.1f}s] " + (" | ".join(parts) or "no rows done yet")
+
+    def close(self):
+        if self.stop:
+            self.stop.set()
+            self.stop = None
+        with self.lock:
+            if self.log:
+                self.log.close()
+                self.log = None
+
+
+# Shared by the functions of the running script
+progress = Progress()
+
+
+@contextlib.contextmanager
+def instrumented_run(metrics_path=None, trace_path=None, progress_interval=default_progress_interval,
+                     progress_log=None):
+    """Collect the calls and row outcomes of a run, then print and write the reports"""
+    collector.reset(trace=bool(trace_path))
+    progress.start(progress_interval, progress_log)
+    try:
+        yield collector
+    finally:
+        progress.close()
+        print(progress.status())
+        collector.print_summary()
+        if metrics_path:
+            with open(metrics_path, 'w') as f:
+                json.dump({"elapsed": round(time.perf_counter() - collector.started, 3),
+                           "rows": {kind: dict(counts) for kind, counts in progress.counts.items()},
+                           "endpoints": collector.summary()}, f, indent=2)
+            print(f"Metrics written to {metrics_path}.")
+        if trace_path:
+            with open(trace_path, 'w') as f:
+                json.dump(collector.chrome_trace(), f)
+            print(f"Trace written to {trace_path}.")
+
+
+def add_instrumentation_arguments(parser):
+    """Add the --metrics, --trace, --progress-interval and --progress-log options"""
+    parser.add_argument("--metrics", help="write per-endpoint call counts, bytes, statuses and latency histograms "
+                                          "to this JSON file")
+    parser.add_argument("--trace", help="write a timeline of every call to this Chrome trace JSON file")
+    parser.add_argument("--progress-interval", type=float, default=default_progress_interval,
+                        help=f"seconds between two progress lines, 0 for none (default: {default_progress_interval})")
+    parser.add_argument("--progress-log", help="write the outcome of every row to this JSON lines file")
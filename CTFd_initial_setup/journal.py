@@ -0,0 +1,106 @@
+import time
+import sqlite3
+import threading
+
+# Journal file shared by the provisioning scripts, one scope per script
+default_journal_path = "provisioning_journal.db"
+
+
+class Journal:
+    """Crash-safe record of the API operations a provisioning run has completed.
+
+    Every successful step is committed to a SQLite file together with the ID
+    the server returned, keyed by the natural key of its CSV row (challenge
+    name, email, team name) and the step name. A resumed run reads the IDs
+    back instead of calling the server again.
+
+    A journal opened without ``replay`` only records: its lookups find
+    nothing, so a run that decides from the live state (sync mode) is not
+    misled by IDs of objects deleted since they were recorded.
+    """
+
+    def __init__(self, path, scope, replay=True):
+        self.scope = scope
+        self.replay = replay
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        # WAL keeps each commit cheap while still surviving a crash of the script
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS operations ("
+            " scope TEXT NOT NULL, row_key TEXT NOT NULL, step TEXT NOT NULL,"
+            " object_id INTEGER, completed_at REAL NOT NULL,"
+            " PRIMARY KEY (scope, row_key, step))"
+        )
+        self.db.commit()
+
+    def get(self, key, step):
+        """Return the ID recorded for a completed step, or None"""
+        if not self.replay:
+            return None
+        with self.lock:
+            row = self.db.execute(
+                "SELECT object_id FROM operations WHERE scope = ? AND row_key = ? AND step = ?",
+                (self.scope, key, step)
+            ).fetchone()
+        return row[0] if row else None
+
+    def done(self, key, step):
+        if not self.replay:
+            return False
+        with self.lock:
+            return self.db.execute(
+                "SELECT 1 FROM operations WHERE scope = ? AND row_key = ? AND step = ?",
+                (self.scope, key, step)
+            ).fetchone() is not None
+
+    def record(self, key, step, object_id=None):
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO operations VALUES (?, ?, ?, ?, ?)",
+                (self.scope, key, step, object_id, time.time())
+            )
+            self.db.commit()
+
+    def records(self):
+        """Return the (row key, step, object ID) of every operation recorded in this scope"""
+        with self.lock:
+            return self.db.execute("SELECT row_key, step, object_id FROM operations WHERE scope = ?",
+                                   (self.scope,)).fetchall()
+
+    def count(self):
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM operations WHERE scope = ?", (self.scope,)).fetchone()[0]
+
+    def reset(self):
+        """Forget the operations of a previous run of this scope"""
+        with self.lock:
+            self.db.execute("DELETE FROM operations WHERE scope = ?", (self.scope,))
+            self.db.commit()
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+def open_journal(path, scope, resume, sync=False):
+    """Open the journal, starting it over unless the run resumes a previous one.
+
+    A sync run keeps the records of the earlier runs and adds its own, so a
+    later --resume still knows every object the journal recorded.
+    """
+    journal = Journal(path, scope, replay=resume or not sync)
+    if resume:
+        print(f"Resuming from {path}: {journal.count()} completed operations recorded.")
+    elif not sync:
+        journal.reset()
+    return journal
+
+
+def add_journal_arguments(parser):
+    """Add the --journal and --resume options shared by the provisioning scripts"""
+    parser.add_argument("--journal", default=default_journal_path,
+                        help=f"SQLite file recording completed operations (default: {default_journal_path})")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue an interrupted run, skipping the operations recorded in the journal")
@@ -0,0 +1,278 @@
+import os
+import re
+import sys
+import time
+import getpass
+import smtplib
+import tarfile
+import zipfile
+import argparse
+import threading
+import configparser
+from csv import DictReader, DictWriter
+from email import message_from_string, policy
+from email.message import EmailMessage
+
+from journal import open_journal, add_journal_arguments, default_journal_path
+from pipeline import Stage
+
+# Optional: mailmerge templates are Jinja2 templates; without it only {{ field }} is substituted
+try:
+    import jinja2
+except ImportError:
+    jinja2 = None
+
+# The files of the mailmerge tool, so existing templates and server configs keep working
+default_database = "mailmerge_database.csv"
+# Credentials of the accounts created by add_user.py and add_team_and_user.py
+accounts_database = "accounts_mail_database.csv"
+default_template = "mailmerge_template.txt"
+default_config = "mailmerge_server.conf"
+
+# SMTP connections kept open in parallel
+default_workers = 4
+
+# Messages per second over all connections, unless the server config has a ratelimit
+default_rate = 5.0
+
+
+class RateLimiter:
+    """Spaces calls out to at most ``rate`` per second, shared by all sender threads"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self.lock = threading.Lock()
+        self.next_slot = time.monotonic()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            slot = max(self.next_slot, now)
+            self.next_slot = slot + self.interval
+        time.sleep(max(0, slot - now))
+
+
+class SmtpPool:
+    """One SMTP connection per sender thread, reused for all the messages it sends"""
+
+    def __init__(self, host, port, security=None, username=None, password=None):
+        self.host = host
+        self.port = port
+        self.security = security
+        self.username = username
+        self.password = password
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.connections = []
+
+    def connect(self):
+        if self.security == "SSL/TLS":
+            smtp = smtplib.SMTP_SSL(self.host, self.port)
+        else:
+            smtp = smtplib.SMTP(self.host, self.port)
+            if self.security == "STARTTLS":
+                smtp.starttls()
+        if self.username and self.security:
+            smtp.login(self.username, self.password)
+        with self.lock:
+            self.connections.append(smtp)
+        return smtp
+
+    def send(self, message):
+        # A connection the server closed after idling is opened again once
+        for attempt in range(2):
+            smtp = getattr(self.local, "smtp", None) or self.connect()
+            self.local.smtp = smtp
+            try:
+                smtp.send_message(message)
+                return
+            except (smtplib.SMTPServerDisconnected, ConnectionError):
+                self.local.smtp = None
+                if attempt:
+                    raise
+
+    def close(self):
+        with self.lock:
+            for smtp in self.connections:
+                try:
+                    smtp.quit()
+                except (smtplib.SMTPException, OSError):
+                    pass
+            self.connections = []
+
+
+class MailDatabase:
+    """A mail merge CSV the account scripts add a row to for every account they create.
+
+    Rows are written as they come, from any thread. With ``append`` (a
+    resumed run) the rows of the interrupted run are kept.
+    """
+
+    def __init__(self, path, fieldnames, append=False):
+        self.lock = threading.Lock()
+        header = not (append and os.path.exists(path) and os.path.getsize(path))
+        self.file = open(path, 'a' if append else 'w', newline='')
+        self.writer = DictWriter(self.file, fieldnames=fieldnames)
+        if header:
+            self.writer.writeheader()
+
+    def add(self, **row):
+        with self.lock:
+            self.writer.writerow(row)
+            self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def add_mail_database_argument(parser):
+    parser.add_argument("--mail-database", default=accounts_database,
+                        help=f"mail merge CSV receiving the credentials of the created accounts, sent later by "
+                             f"mailer.py; not written with --notify (default: {accounts_database})")
+
+
+def read_databases(paths):
+    """Rows of one mail merge database, streamed; rows of several are merged by email.
+
+    Merging lets a user get their credentials (account scripts) and their
+    WireGuard config (wireguard.py) in one message. It holds the rows in
+    memory, ordered by their first appearance.
+    """
+    if len(paths) == 1:
+        with open(paths[0], newline='') as f:
+            yield from DictReader(f)
+        return
+    rows = {}
+    for path in paths:
+        with open(path, newline='') as f:
+            for row in DictReader(f):
+                rows.setdefault(row["email"].lower(), {}).update({k: v for k, v in row.items() if v})
+    yield from rows.values()
+
+
+def compile_template(text):
+    """Return a function rendering the template with the fields of a row"""
+    if jinja2:
+        return jinja2.Template(text, keep_trailing_newline=True).render
+    return lambda **row: re.sub(r"\{\{\s*(\w+)\s*\}\}", lambda m: str(row.get(m.group(1), "")), text)
+
+
+# Archive members are read by one sender thread at a time
+archive_lock = threading.Lock()
+
+
+def read_attachment(path, archive=None):
+    """Read an attachment from disk, or from the config archive written by wireguard.py"""
+    if os.path.exists(path) or archive is None:
+        with open(path, 'rb') as f:
+            return f.read()
+    with archive_lock:
+        if isinstance(archive, zipfile.ZipFile):
+            return archive.read(path)
+        return archive.extractfile(path).read()
+
+
+def build_message(render, row, archive=None):
+    """Render a mailmerge template (headers, blank line, body) with its ATTACHMENT headers"""
+    parsed = message_from_string(render(**row), policy=policy.default)
+    message = EmailMessage()
+    for key, value in parsed.items():
+        if key.upper() not in ("ATTACHMENT", "CONTENT-TYPE", "MIME-VERSION", "CONTENT-TRANSFER-ENCODING"):
+            message[key] = value
+    message.set_content(parsed.get_content(), subtype=parsed.get_content_subtype())
+    # Rows without a WireGuard config render an empty ATTACHMENT header
+    for path in filter(str.strip, parsed.get_all("ATTACHMENT") or []):
+        message.add_attachment(read_attachment(path, archive), maintype="application", subtype="octet-stream",
+                               filename=os.path.basename(path))
+    return message
+
+
+def open_archive(path):
+    return zipfile.ZipFile(path) if path.endswith(".zip") else tarfile.open(path)
+
+
+def main(databases=None, template_path=default_template, config_path=default_config,
+         archive_path=None, workers=default_workers, rate=None, journal_path=default_journal_path, resume=False):
+    # By default whichever of the account scripts' and wireguard.py's databases exist
+    databases = databases or [path for path in (accounts_database, default_database) if os.path.exists(path)]
+    missing = [path for path in databases if not os.path.isfile(path)]
+    if not databases or missing:
+        print(f"Mail merge database {', '.join(missing) or f'{accounts_database} or {default_database}'} not "
+              f"found. It is written by add_user.py, add_team_and_user.py (without --notify) and wireguard.py.")
+        return 1
+    config = configparser.ConfigParser()
+    if not config.read(config_path):
+        print(f"SMTP server config {config_path} not found.")
+        return 1
+    server = config["smtp_server"]
+    security = server.get("security")
+    username = server.get("username")
+    password = None
+    if username and security:
+        password = os.environ.get("SMTP_PASSWORD") or getpass.getpass(f">>> password for {username} on "
+                                                                      f"{server['host']}: ")
+    if rate is None:
+        # mailmerge's ratelimit is in messages per minute
+        rate = server.getfloat("ratelimit", 0) / 60 or default_rate
+
+    with open(template_path) as f:
+        render = compile_template(f.read())
+    archive = open_archive(archive_path) if archive_path else None
+    smtp = SmtpPool(server["host"], server.getint("port", 25), security, username, password)
+    limiter = RateLimiter(rate)
+    journal = open_journal(journal_path, "mail", resume)
+    failed = []
+
+    def send(row):
+        email = row["email"]
+        if journal.done(email, "sent"):
+            return
+        try:
+            message = build_message(render, row, archive)
+            limiter.wait()
+            smtp.send(message)
+        except (smtplib.SMTPException, OSError, KeyError) as e:
+            print(f"Failed to send to {email}: {e}")
+            failed.append(email)
+            return
+        journal.record(email, "sent")
+        print(f"Sent to {email}")
+
+    stage = Stage("mail", send, workers).start()
+    for row in read_databases(databases):
+        stage.put(row)
+    stage.close()
+    smtp.close()
+    journal.close()
+    if archive:
+        archive.close()
+
+    print(stage.summary())
+    if failed:
+        print(f"{len(failed)} messages could not be sent, rerun with --resume to retry them.")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Send the credentials and WireGuard configs of the mail merge "
+                                                 "database over pooled SMTP connections")
+    parser.add_argument("--database", action="append",
+                        help=f"CSV with one row per message, repeat it to merge several by email (default: "
+                             f"{accounts_database} and {default_database}, those that exist)")
+    parser.add_argument("--template", default=default_template,
+                        help=f"mailmerge template (default: {default_template})")
+    parser.add_argument("--config", default=default_config,
+                        help=f"mailmerge SMTP server config (default: {default_config})")
+    parser.add_argument("--archive", help="zip or tar archive holding the attachments, from wireguard.py --output")
+    parser.add_argument("--workers", type=int, default=default_workers,
+                        help=f"SMTP connections sending in parallel (default: {default_workers})")
+    parser.add_argument("--rate", type=float, default=None,
+                        help=f"messages per second over all connections (default: the ratelimit of the "
+                             f"server config, else {default_rate})")
+    add_journal_arguments(parser)
+    args = parser.parse_args()
+    sys.exit(main(args.database, args.template, args.config, args.archive, args.workers, args.rate,
+                  args.journal, args.resume))
@@ -0,0 +1,215 @@
+import os
+import sys
+import time
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import requests
+import urllib3
+
+from challenge_graph import dependents_of
+
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+setup_dir = os.path.dirname(os.path.abspath(__file__))
+automation_dir = os.path.dirname(setup_dir)
+
+# Same defaults as setup.sh
+ctfd_dir = "/home/ubuntu/CTFd"
+ctfd_url = "https://127.0.0.1"
+container_name = "ctfd-ctfd-1"
+plugin_repo = "https://github.com/krzys-h/CTFd_first_blood.git"
+
+# Longest wait for a readiness signal, in seconds
+default_timeout = 300
+
+
+def wait_until(name, probe, timeout=default_timeout, initial_delay=0.2, max_delay=5):
+    """Poll ``probe`` with exponential backoff until it returns a true value, which is returned"""
+    start = time.monotonic()
+    delay = initial_delay
+    while True:
+        try:
+            result = probe()
+        except (requests.RequestException, subprocess.SubprocessError, OSError):
+            result = None
+        if result:
+            print(f"{name} ready after {time.monotonic() - start:.1f}s.")
+            return result
+        if time.monotonic() - start + delay > timeout:
+            raise TimeoutError(f"{name} not ready after {timeout}s")
+        time.sleep(delay)
+        delay = min(delay * 2, max_delay)
+
+
+def http_ready(url=ctfd_url):
+    """CTFd answers /setup through nginx: the setup form, or a redirect once set up"""
+    r = requests.get(f"{url}/setup", verify=False, timeout=5, allow_redirects=False)
+    return r.status_code in (200, 302)
+
+
+def db_ready(ctfd_path=ctfd_dir):
+    """The database container accepts connections"""
+    return subprocess.run(
+        ["docker", "compose", "exec", "-T", "db", "sh", "-c",
+         "mariadb-admin ping -h localhost --silent || mysqladmin ping -h localhost --silent"],
+        cwd=ctfd_path, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=10
+    ).returncode == 0
+
+
+def token_valid(token, url=ctfd_url):
+    # Without the JSON content type CTFd ignores the token and the probe never succeeds
+    r = requests.get(f"{url}/api/v1/users/me", headers={"Authorization": f"Token {token}",
+                                                        "Content-Type": "application/json"},
+                     verify=False, timeout=5)
+    return r.status_code == 200
+
+
+def run(command, cwd=None):
+    # Not echoed: the ctfd_setup.py arguments include the admin password
+    subprocess.run(command, cwd=cwd, check=True)
+
+
+def retrieve_token(container=container_name):
+    """Copy get_api.py into the container and return the token it generates"""
+    run(["docker", "cp", os.path.join(setup_dir, "get_api.py"), f"{container}:/opt/CTFd/CTFd/utils/security/"])
+    output = subprocess.run(
+        ["docker", "exec", container, "python3", "/opt/CTFd/CTFd/utils/security/get_api.py"],
+        stdout=subprocess.PIPE, text=True, check=True
+    ).stdout
+    for line in output.splitlines():
+        if "Generated Token:" in line:
+            return line.split()[2].strip()
+    return None
+
+
+def run_stages(stages, workers=4):
+    """Run a DAG of stages, each as soon as the stages it depends on have succeeded.
+
+    ``stages`` maps a stage name to (function, names of the stages it needs).
+    Functions receive the results of the finished stages by name. Returns the
+    names of the stages that failed or were skipped because of a failure.
+    """
+    graph = {name: deps for name, (_, deps) in stages.items()}
+    dependents = dependents_of(graph)
+    remaining = {name: len(deps) for name, deps in graph.items()}
+    results, started = {}, time.monotonic()
+
+    def timed(name):
+        start = time.monotonic()
+        print(f"[{time.monotonic() - started:6.1f}s] {name} started")
+        result = stages[name][0](results)
+        print(f"[{time.monotonic() - started:6.1f}s] {name} finished in {time.monotonic() - start:.1f}s")
+        return result
+
+    failed = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        running = {pool.submit(timed, name): name for name in graph if remaining[name] == 0}
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    results[name] = future.result()
+                except Exception as e:
+                    print(f"Stage {name} failed: {e}")
+                    failed.append(name)
+                    continue
+                for dependent in dependents[name]:
+                    remaining[dependent] -= 1
+                    if remaining[dependent] == 0:
+                        running[pool.submit(timed, dependent)] = dependent
+
+    skipped = [name for name in graph if name not in results and name not in failed]
+    for name in skipped:
+        print(f"Stage {name} skipped: a stage it depends on failed.")
+    print(f"Total time: {time.monotonic() - started:.1f}s")
+    return failed + skipped
+
+
+def build_stages(mode, admin_username, admin_email, admin_password, plugin=False, challenges=False,
+                 accounts=False, wireguard=False, emails=False, ctfd_path=ctfd_dir, url=ctfd_url,
+                 container=container_name, timeout=default_timeout):
+    """The setup.sh steps as a DAG, with readiness probes in place of its sleeps"""
+    python = sys.executable
+    stages = {
+        "compose_up": (lambda r: run(["docker", "compose", "up", "-d"], cwd=ctfd_path), []),
+        "web_ready": (lambda r: wait_until("CTFd web", lambda: http_ready(url), timeout), ["compose_up"]),
+        "db_ready": (lambda r: wait_until("Database", lambda: db_ready(ctfd_path), timeout), ["compose_up"]),
+        "ctfd_setup": (lambda r: run([python, os.path.join(setup_dir, "ctfd_setup.py"), mode, admin_username,
+                                      admin_email, admin_password, url]), ["web_ready", "db_ready"]),
+    }
+
+    def api_token(r):
+        # Generated once, then returned as soon as the API accepts it
+        token = wait_until("Token generation", lambda: retrieve_token(container), timeout)
+        wait_until("API token", lambda: token_valid(token, url), timeout)
+        return token
+    stages["api_token"] = (api_token, ["ctfd_setup"])
+
+    # Challenge and account imports need the server in its final state
+    ctfd_final = ["api_token"]
+    if plugin:
+        # The other service images are refreshed while CTFd is set up, and taken up by the restart below
+        stages["compose_pull"] = (lambda r: run(["docker", "compose", "pull"], cwd=ctfd_path), ["compose_up"])
+
+        def install_plugin(r):
+            plugin_dir = os.path.join(ctfd_path, "CTFd", "plugins", "CTFd_first_blood")
+            if not os.path.isdir(plugin_dir):
+                run(["git", "clone", plugin_repo], cwd=os.path.join(ctfd_path, "CTFd", "plugins"))
+            run(["docker", "compose", "build"], cwd=ctfd_path)
+            run(["docker", "compose", "up", "-d"], cwd=ctfd_path)
+            wait_until("CTFd web", lambda: http_ready(url), timeout)
+            wait_until("API token", lambda: token_valid(r["api_token"], url), timeout)
+        stages["first_blood_plugin"] = (install_plugin, ["api_token", "compose_pull"])
+        ctfd_final = ["first_blood_plugin"]
+
+        # The build cache is only cleaned up once the rebuilt CTFd runs, alongside the imports
+        stages["builder_prune"] = (lambda r: run(["docker", "builder", "prune", "-a", "-f"]), ["first_blood_plugin"])
+
+    if challenges:
+        stages["challenges"] = (lambda r: run([python, os.path.join(setup_dir, "challenges.py"), r["api_token"],
+                                               "--url", url]), ctfd_final)
+    if accounts:
+        script = "add_user.py" if mode == "users" else "add_team_and_user.py"
+        stages["accounts"] = (lambda r: run([python, os.path.join(setup_dir, script), r["api_token"], "--url", url]),
+                              ctfd_final)
+    # WireGuard peers only talk to OPNsense, so they are created while CTFd starts
+    if wireguard:
+        stages["wireguard"] = (lambda r: run([python, os.path.join(automation_dir, "wireguard_peers_add",
+                                                                   "wireguard.py")]), [])
+    if emails:
+        # Credentials come from the account scripts, configs from wireguard.py, merged per user
+        databases = [option for name, database in (("accounts", "accounts_mail_database.csv"),
+                                                   ("wireguard", "mailmerge_database.csv"))
+                     if name in stages for option in ("--database", database)]
+        stages["emails"] = (lambda r: run([python, os.path.join(setup_dir, "mailer.py")] + databases),
+                            [name for name in ("accounts", "wireguard") if name in stages])
+    return stages
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Set up CTFd, its content and the WireGuard peers, "
+                                                 "running independent steps concurrently")
+    parser.add_argument("mode", choices=["users", "teams"], help="CTFd user mode")
+    parser.add_argument("admin_username")
+    parser.add_argument("admin_email")
+    parser.add_argument("admin_password")
+    parser.add_argument("--plugin", action="store_true", help="install the first_blood plugin")
+    parser.add_argument("--challenges", action="store_true", help="import challenges.csv")
+    parser.add_argument("--accounts", action="store_true", help="create the users, or teams in team mode")
+    parser.add_argument("--wireguard", action="store_true", help="create the WireGuard peers")
+    parser.add_argument("--emails", action="store_true", help="send the mail merge once accounts and peers exist")
+    parser.add_argument("--ctfd-dir", default=ctfd_dir, help=f"CTFd docker compose directory (default: {ctfd_dir})")
+    parser.add_argument("--url", default=ctfd_url, help=f"CTFd URL (default: {ctfd_url})")
+    parser.add_argument("--container", default=container_name,
+                        help=f"CTFd container name (default: {container_name})")
+    parser.add_argument("--timeout", type=float, default=default_timeout,
+                        help=f"longest wait for a service to become ready, in seconds (default: {default_timeout})")
+    args = parser.parse_args()
+    stages = build_stages(args.mode, args.admin_username, args.admin_email, args.admin_password, args.plugin,
+                          args.challenges, args.accounts, args.wireguard, args.emails, args.ctfd_dir, args.url,
+                          args.container, args.timeout)
+    failed = run_stages(stages)
+    sys.exit(1 if failed else 0)
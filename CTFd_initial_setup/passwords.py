@@ -0,0 +1,28 @@
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+# Adjust the Python path to include CTFd module directory, as in get_api.py
+sys.path.append('/opt/CTFd')  # Update this path if necessary
+
+# Inside the CTFd container its own hash function is used; elsewhere passlib's
+# bcrypt_sha256, the scheme CTFd uses, produces the same hashes
+try:
+    from CTFd.utils.crypto import hash_password
+except ImportError:
+    try:
+        from passlib.hash import bcrypt_sha256
+    except ImportError:
+        bcrypt_sha256 = None
+
+    def hash_password(plaintext):
+        if bcrypt_sha256 is None:
+            raise RuntimeError("hashing CTFd passwords needs CTFd or the passlib and bcrypt packages")
+        return bcrypt_sha256.hash(str(plaintext))
+
+
+def hash_passwords(passwords, processes=None):
+    """Hash passwords with CTFd's scheme, spread over a process pool"""
+    if processes == 1 or len(passwords) < 2:
+        return [hash_password(p) for p in passwords]
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        return list(pool.map(hash_password, passwords, chunksize=64))
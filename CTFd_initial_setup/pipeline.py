@@ -0,0 +1,86 @@
+import time
+import threading
+from queue import Queue
+
+
+class Stage:
+    """A pool of worker threads fed through a bounded queue.
+
+    ``handler`` is called with every item put on the stage and usually puts
+    its result on the next stage; a full queue blocks the producer, which
+    keeps a slow endpoint from piling up unbounded work in memory.
+    """
+
+    def __init__(self, name, handler, workers=1, queue_size=100):
+        self.name = name
+        self.handler = handler
+        self.queue = Queue(maxsize=queue_size)
+        self.threads = [threading.Thread(target=self._run, daemon=True) for _ in range(workers)]
+        self.lock = threading.Lock()
+        self.processed = 0
+        self.errors = 0
+        self.max_depth = 0
+        self.depth_total = 0
+        self.depth_samples = 0
+        self.started = None
+        self.finished = None
+
+    def start(self):
+        self.started = time.perf_counter()
+        for thread in self.threads:
+            thread.start()
+        return self
+
+    def put(self, item):
+        self.queue.put(item)
+        depth = self.queue.qsize()
+        with self.lock:
+            self.max_depth = max(self.max_depth, depth)
+            self.depth_total += depth
+            self.depth_samples += 1
+
+    def close(self):
+        """Wait for the queued items to be handled and stop the workers"""
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.finished = time.perf_counter()
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            try:
+                self.handler(item)
+            except Exception as e:
+                print(f"[{self.name}] Unexpected error: {e}")
+                with self.lock:
+                    self.errors += 1
+            with self.lock:
+                self.processed += 1
+
+    def throughput(self):
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        return self.processed / elapsed if elapsed > 0 else 0.0
+
+    def status(self):
+        return f"{self.name}: {self.processed} done, queue depth {self.queue.qsize()}, {self.throughput():.1f}/sec"
+
+    def summary(self):
+        avg_depth = self.depth_total / self.depth_samples if self.depth_samples else 0
+        return (f"{self.name}: {self.processed} items ({self.errors} errors), {self.throughput():.1f}/sec, "
+                f"queue depth avg {avg_depth:.1f} max {self.max_depth}")
+
+
+def monitor(stages, interval):
+    """Print the status of every stage every ``interval`` seconds until stopped"""
+    stop = threading.Event()
+
+    def run():
+        while not stop.wait(interval):
+            print(" | ".join(stage.status() for stage in stages))
+
+    threading.Thread(target=run, daemon=True).start()
+    return stop
@@ -0,0 +1,189 @@
+import re
+import sys
+import json
+from csv import DictReader
+
+# CSV file paths, the same ones add_user.py and add_team_and_user.py read
+users_csv_path = "/home/ubuntu/ctfd_automation/csv_files/users.csv"
+teams_csv_path = "/home/ubuntu/ctfd_automation/csv_files/team_and_users.csv"
+
+# Deliberately loose: catches typos and shifted columns, CTFd does the strict check
+email_pattern = re.compile(r"[^@\s|]+@[^@\s|]+\.[^@\s|]+")
+
+# Problems printed before a run; the others are only counted
+max_reported = 20
+
+
+class RosterError(ValueError):
+    pass
+
+
+def read_rows(path):
+    """Yield (line number, row, error) for every row of a CSV or JSON lines file, reading one row at a time"""
+    with open(path, newline='') as file:
+        if path.endswith((".jsonl", ".ndjson")):
+            for number, line in enumerate(file, 1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield number, None, f"invalid JSON: {e.msg}"
+                    continue
+                yield (number, row, None) if isinstance(row, dict) else (number, None, "not a JSON object")
+        else:
+            reader = DictReader(file)
+            for row in reader:
+                yield reader.line_num, row, None
+
+
+def field(row, key, strip=True):
+    value = row.get(key)
+    value = "" if value is None else str(value)
+    if not value.strip():
+        raise RosterError(f"{key} is missing")
+    return value.strip() if strip else value
+
+
+def check_email(email):
+    if not email_pattern.fullmatch(email):
+        raise RosterError(f"{email!r} is not an email address")
+    return email
+
+
+def parse_user(row):
+    """A users.csv row (username, email, password) as {name, email, password}"""
+    return {"name": field(row, "username"), "email": check_email(field(row, "email")),
+            "password": field(row, "password", strip=False)}
+
+
+def parse_team(row):
+    """A team_and_users.csv row as {name, password, members}.
+
+    ``members`` is a string of username|password|email triples, or in JSON
+    lines a list of {username, password, email} objects. Member names are
+    derived from the emails, as add_team_and_user.py always did.
+    """
+    members = row.get("members")
+    if isinstance(members, list):
+        triples = [[m.get("username"), m.get("password"), m.get("email")] if isinstance(m, dict) else m
+                   for m in members]
+    else:
+        parts = field(row, "members").split("|")
+        if len(parts) % 3:
+            raise RosterError(f"members has {len(parts)} fields, expected username|password|email triples")
+        triples = [parts[i:i + 3] for i in range(0, len(parts), 3)]
+    team = {"name": field(row, "team"), "password": field(row, "team_password", strip=False), "members": []}
+    for index, triple in enumerate(triples, 1):
+        if not isinstance(triple, list) or len(triple) != 3 or not all(triple):
+            raise RosterError(f"member {index} is not a username|password|email triple")
+        email = check_email(str(triple[2]).strip())
+        team["members"].append({"name": email.split("@")[0], "email": email, "password": str(triple[1])})
+    if not team["members"]:
+        raise RosterError("the team has no members")
+    return team
+
+
+class Roster:
+    """A users or teams file, validated in one streaming pass and then streamed again row by row.
+
+    Validation keeps only the 64-bit hash of every key that must be unique
+    (lowercased emails, user and team names) and the line numbers of bad
+    rows, never the rows themselves, so memory grows by a few dozen bytes per
+    row whatever their length.
+    """
+
+    def __init__(self, path, kind="users"):
+        self.path = path
+        self.kind = kind
+        self.parse = parse_user if kind == "users" else parse_team
+        self.invalid = None
+        self.problems = []
+        self.rows = 0
+
+    def validate(self):
+        """Check every row, returning the (line number, problem) of the bad ones.
+
+        Later rows repeating an email, a user name or a team name are bad;
+        the first one is kept.
+        """
+        emails, names, teams = set(), set(), set()
+        self.invalid, self.problems, self.rows = set(), [], 0
+        for number, row, error in read_rows(self.path):
+            self.rows += 1
+            try:
+                if error:
+                    raise RosterError(error)
+                record = self.parse(row)
+                users = record["members"] if self.kind == "teams" else [record]
+                if self.kind == "teams" and hash(record["name"]) in teams:
+                    raise RosterError(f"duplicate team name {record['name']!r}")
+                # The whole row is checked before any of its keys is kept, so a rejected
+                # row does not make later rows look like duplicates
+                row_emails, row_names = set(), set()
+                for user in users:
+                    email, name = hash(user["email"].lower()), hash(user["name"])
+                    if email in emails or email in row_emails:
+                        raise RosterError(f"duplicate email {user['email']!r}")
+                    if name in names or name in row_names:
+                        raise RosterError(f"duplicate user name {user['name']!r}")
+                    row_emails.add(email)
+                    row_names.add(name)
+                emails |= row_emails
+                names |= row_names
+                teams.add(hash(record["name"]))
+            except RosterError as e:
+                self.invalid.add(number)
+                self.problems.append((number, str(e)))
+        return self.problems
+
+    def __iter__(self):
+        """Yield the records of the valid rows, parsing each row only when it is consumed"""
+        for number, row, error in read_rows(self.path):
+            if self.invalid is not None:
+                if number not in self.invalid:
+                    yield self.parse(row)
+                continue
+            if error:
+                raise RosterError(f"{self.path} line {number}: {error}")
+            try:
+                yield self.parse(row)
+            except RosterError as e:
+                raise RosterError(f"{self.path} line {number}: {e}") from None
+
+
+def open_roster(path, kind="users", skip_invalid=False):
+    """Validate a roster before any API call and return it ready to stream.
+
+    Bad rows are reported up front; the run stops unless they are skipped.
+    """
+    roster = Roster(path, kind)
+    problems = roster.validate()
+    if problems:
+        print(f"{path}: {len(problems)} of {roster.rows} rows are invalid:")
+        for number, problem in problems[:max_reported]:
+            print(f"  line {number}: {problem}")
+        if len(problems) > max_reported:
+            print(f"  ... and {len(problems) - max_reported} more")
+        if not skip_invalid:
+            print("Fix them, or pass --skip-invalid to provision the valid rows only.")
+            sys.exit(1)
+        print(f"Skipping them, {roster.rows - len(problems)} rows left.")
+    return roster
+
+
+def add_roster_arguments(parser, default_path):
+    """Add the --roster and --skip-invalid options shared by the scripts reading users and teams"""
+    parser.add_argument("--roster", default=default_path,
+                        help=f"CSV, or JSON lines (.jsonl) file with the same fields (default: {default_path})")
+    parser.add_argument("--skip-invalid", action="store_true",
+                        help="provision the valid rows when some rows are invalid, instead of stopping")
+
+
+def read_users(csv_path=users_csv_path):
+    return list(open_roster(csv_path, "users"))
+
+
+def read_teams(csv_path=teams_csv_path):
+    """Read team_and_users.csv into teams and their members, names derived from emails like add_team_and_user.py"""
+    return list(open_roster(csv_path, "teams"))
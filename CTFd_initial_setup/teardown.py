@@ -0,0 +1,204 @@
+import os
+import sys
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from ctfd_client import (create_session, request_with_retry, add_url_argument, add_pool_argument,
+                         add_retry_arguments, default_url, default_pool_size, default_retries, default_backoff)
+from ctfd_state import fetch_all
+from journal import Journal, default_journal_path
+from instrumentation import progress, instrumented_run, add_instrumentation_arguments
+
+# The WireGuard helpers, which share the pooled session code of this directory
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "wireguard_peers_add"))
+import wireguard
+
+# DELETE calls in flight at once
+default_workers = 16
+
+# Objects are deleted in phases, each phase only once the previous one is done:
+# memberships before teams, hints, flags and files before their challenges
+phases = (("memberships", "hints", "flags", "files"), ("challenges", "teams", "users"))
+
+
+def empty_plan():
+    return {kind: [] for phase in phases for kind in phase}
+
+
+def list_provisioned(session, url, challenges=True, accounts=True):
+    """Everything on the instance except admin accounts, with one paginated GET per object type"""
+    plan = empty_plan()
+    api_url = f"{url}/api/v1"
+    if challenges:
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            lists = {kind: pool.submit(fetch_all, session, f"{api_url}/{kind}", params) for kind, params in
+                     (("challenges", {"view": "admin"}), ("hints", None), ("flags", None),
+                      ("files", {"type": "challenge"}))}
+            for kind, items in lists.items():
+                plan[kind] = [item["id"] for item in items.result()]
+    if accounts:
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            users = pool.submit(fetch_all, session, f"{api_url}/users", {"view": "admin"})
+            teams = pool.submit(fetch_all, session, f"{api_url}/teams", {"view": "admin"})
+            users, teams = [u for u in users.result() if u.get("type") != "admin"], teams.result()
+        plan["users"] = [u["id"] for u in users]
+        plan["teams"] = [t["id"] for t in teams]
+        plan["memberships"] = [(u["team_id"], u["id"]) for u in users if u.get("team_id")]
+    return plan
+
+
+def journal_provisioned(journal_path, challenges=True, accounts=True):
+    """Only the objects a provisioning run recorded in the journal"""
+    plan = empty_plan()
+    if challenges:
+        for key, step, object_id in Journal(journal_path, "challenges").records():
+            kind = {"challenge": "challenges", "flag": "flags"}.get(step) or \
+                {"hint": "hints", "file": "files"}.get(step.rstrip("0123456789"))
+            if kind and object_id:
+                plan[kind].append(object_id)
+    if accounts:
+        plan["users"] = [object_id for _, step, object_id in Journal(journal_path, "users").records()
+                         if step == "user" and object_id]
+        created, members = {}, []
+        for key, step, object_id in Journal(journal_path, "teams").records():
+            if step == "team":
+                plan["teams"].append(object_id)
+            elif step == "user":
+                created[key] = object_id
+            elif step == "member":
+                members.append((object_id, key))
+        plan["users"] += list(created.values())
+        # Members that existed before the run are not deleted; CTFd unlinks them with their team
+        plan["memberships"] = [(team_id, created[email]) for team_id, email in members if email in created]
+    return plan
+
+
+def delete_object(session, url, kind, item, retries=default_retries, backoff=default_backoff):
+    """Delete an object, or a membership for (team ID, user ID); objects already gone count as deleted"""
+    try:
+        if kind == "memberships":
+            team_id, user_id = item
+            r = request_with_retry(session, "DELETE", f"{url}/api/v1/teams/{team_id}/members", retries=retries,
+                                   backoff=backoff, json={"user_id": user_id}, verify=False)
+        else:
+            r = request_with_retry(session, "DELETE", f"{url}/api/v1/{kind}/{item}", retries=retries,
+                                   backoff=backoff, verify=False)
+    except requests.ConnectionError as e:
+        progress.fail(kind, item, e)
+        return False
+    if r.status_code in (200, 404):
+        progress.ok(kind, item)
+        return True
+    progress.fail(kind, item, f"{r.status_code} - {r.text}")
+    return False
+
+
+def run_phases(session, url, plan, workers=default_workers, retries=default_retries, backoff=default_backoff):
+    """Delete the planned objects phase by phase, concurrently within a phase. Returns the failed count."""
+    failed = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for phase in phases:
+            futures = [pool.submit(delete_object, session, url, kind, item, retries, backoff)
+                       for kind in phase for item in plan[kind]]
+            failed += sum(not f.result() for f in futures)
+    return failed
+
+
+def wireguard_teardown(wireguard_dir, workers=default_workers, retries=default_retries, dry_run=False, confirm=None):
+    """Remove the peers pointing at the endpoint of wireguard.conf, then apply them with one reconfigure"""
+    api_user, api_password = wireguard.read_api_key(os.path.join(wireguard_dir, "apikey.txt"))
+    with open(os.path.join(wireguard_dir, "wireguard.conf")) as f:
+        _, _, opnsense_ip, endpoit_ip, endpoint_port = wireguard.parse_template(list(f))
+    clients = wireguard.endpoint_clients(wireguard.fetch_clients(opnsense_ip, api_user, api_password),
+                                         endpoit_ip, endpoint_port)
+    print(f"{len(clients)} WireGuard peers on {endpoit_ip}:{endpoint_port}.")
+    if dry_run or not clients or (confirm and not confirm()):
+        return 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(wireguard.delete_wireguard_peer, opnsense_ip, api_user, api_password, c["uuid"],
+                               retries) for c in clients]
+        failed = sum(not f.result() for f in futures)
+    wireguard.wireguard_reconfigure(opnsense_ip, api_user, api_password)
+    return failed
+
+
+def main(token=None, challenges=True, accounts=True, peers=True, from_journal=False,
+         journal_path=default_journal_path, workers=default_workers, pool_size=default_pool_size,
+         retries=default_retries, backoff=default_backoff, wireguard_dir=".", yes=False, dry_run=False,
+         url=default_url):
+    def confirm():
+        return yes or input(">>> Delete them? [y/N] ").strip().lower() == "y"
+
+    # Checked up front, so a missing file does not abort the run after the CTFd deletions
+    if peers:
+        missing = [name for name in ("apikey.txt", "wireguard.conf")
+                   if not os.path.isfile(os.path.join(wireguard_dir, name))]
+        if missing:
+            print(f"No {' or '.join(missing)} in {os.path.abspath(wireguard_dir)}, WireGuard peers are not "
+                  f"removed. Point --wireguard-dir at the directory of wireguard.py.")
+            if not (challenges or accounts):
+                return 1
+            peers = False
+
+    failed = 0
+    if challenges or accounts:
+        if not token:
+            print("An API token is needed to remove challenges and accounts.")
+            return 1
+        url = url.rstrip("/")
+        session = create_session(token, pool_size)
+        if from_journal:
+            plan = journal_provisioned(journal_path, challenges, accounts)
+        else:
+            plan = list_provisioned(session, url, challenges, accounts)
+        print("To delete: " + ", ".join(f"{len(plan[kind])} {kind}" for phase in phases for kind in phase) + ".")
+        if not dry_run and any(plan.values()) and confirm():
+            failed += run_phases(session, url, plan, workers, retries, backoff)
+            # Recorded IDs are gone, a later provisioning run must not resume from them
+            if from_journal and not failed:
+                for scope in ("challenges", "users", "teams"):
+                    Journal(journal_path, scope).reset()
+
+    if peers:
+        failed += wireguard_teardown(wireguard_dir, workers, retries, dry_run, confirm)
+
+    if failed:
+        print(f"{failed} deletions failed, run the teardown again to retry them.")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Delete the provisioned challenges, users, teams and WireGuard "
+                                                 "peers, e.g. between two rounds on the same instance")
+    parser.add_argument("token", nargs="?", help="CTFd admin API token (not needed with only --wireguard)")
+    parser.add_argument("--challenges", action="store_true", help="delete challenges with their hints, flags "
+                                                                  "and files")
+    parser.add_argument("--accounts", action="store_true", help="delete teams, memberships and non-admin users")
+    parser.add_argument("--wireguard", action="store_true", help="delete the WireGuard peers of the endpoint in "
+                                                                 "wireguard.conf")
+    parser.add_argument("--from-journal", action="store_true",
+                        help="only delete the objects recorded in the journal by the provisioning scripts, "
+                             "instead of everything listed on CTFd")
+    parser.add_argument("--journal", default=default_journal_path,
+                        help=f"journal written by the provisioning scripts (default: {default_journal_path})")
+    parser.add_argument("--wireguard-dir", default=".",
+                        help="directory with the apikey.txt and wireguard.conf of wireguard.py (default: .)")
+    parser.add_argument("--workers", type=int, default=default_workers,
+                        help=f"deletions in flight at once (default: {default_workers})")
+    parser.add_argument("--dry-run", action="store_true", help="only show what would be deleted")
+    parser.add_argument("--yes", action="store_true", help="do not ask for confirmation")
+    add_url_argument(parser)
+    add_pool_argument(parser)
+    add_retry_arguments(parser)
+    add_instrumentation_arguments(parser)
+    args = parser.parse_args()
+    # Without a selection, everything is torn down
+    everything = not (args.challenges or args.accounts or args.wireguard)
+    with instrumented_run(args.metrics, args.trace, args.progress_interval, args.progress_log):
+        code = main(args.token, args.challenges or everything, args.accounts or everything,
+                    args.wireguard or everything, args.from_journal, args.journal, args.workers, args.pool_size,
+                    args.retries, args.backoff, args.wireguard_dir, args.yes, args.dry_run, args.url)
+    sys.exit(code)
@@ -0,0 +1,77 @@
+import os
+import csv
+import tempfile
+import unittest
+
+# CTFd and its dependencies are only installed next to a CTFd instance, e.g. inside its container
+try:
+    from sqlalchemy import create_engine, select
+    import bulk_load
+except ImportError:
+    bulk_load = None
+
+
+def user(name):
+    return {"name": name, "email": f"{name}@example.com", "password": f"{name}-password"}
+
+
+@unittest.skipIf(bulk_load is None, "CTFd cannot be imported")
+class BulkLoadSQLite(unittest.TestCase):
+    """The bulk load against an empty SQLite database, created like --create-schema does"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.database_url = f"sqlite:///{os.path.join(self.directory.name, 'ctfd.db')}"
+        users_csv = os.path.join(self.directory.name, "users.csv")
+        with open(users_csv, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(["username", "email", "password"])
+            for name in ("alice", "bob"):
+                writer.writerow([name, f"{name}@example.com", f"{name}-password"])
+        bulk_load.main("users", users_csv, self.database_url, processes=1, create_schema=True)
+        self.engine = create_engine(self.database_url)
+
+    def tearDown(self):
+        self.engine.dispose()
+        self.directory.cleanup()
+
+    def rows(self, table):
+        with self.engine.connect() as conn:
+            return {row.name: row for row in conn.execute(select(table))}
+
+    def test_insert_users_skips_existing_emails_and_names(self):
+        with self.engine.begin() as conn:
+            ids = bulk_load.insert_users(conn, [user("alice"), user("carol"),
+                                                {**user("bob"), "email": "other@example.com"}], processes=1)
+        users = self.rows(bulk_load.Users.__table__)
+        self.assertEqual(sorted(users), ["alice", "bob", "carol"])
+        self.assertEqual(users["bob"].email, "bob@example.com")
+        self.assertEqual(ids, {"alice@example.com": users["alice"].id, "carol@example.com": users["carol"].id})
+        self.assertNotEqual(users["carol"].password, "carol-password")
+
+    def test_teams_and_members(self):
+        teams = [{"name": "Red", "password": "red", "members": [user("alice"), user("carol")]},
+                 {"name": "Blue", "password": "blue", "members": [user("bob")]}]
+        with self.engine.begin() as conn:
+            user_ids = bulk_load.insert_users(conn, [m for t in teams for m in t["members"]], processes=1)
+            team_ids = bulk_load.insert_teams(conn, teams, processes=1)
+            linked = bulk_load.link_members(conn, [(team_ids[t["name"]], user_ids[m["email"]])
+                                                   for t in teams for m in t["members"]])
+        self.assertEqual(linked, 3)
+        users = self.rows(bulk_load.Users.__table__)
+        saved_teams = self.rows(bulk_load.Teams.__table__)
+        self.assertEqual(users["alice"].team_id, saved_teams["Red"].id)
+        self.assertEqual(users["carol"].team_id, saved_teams["Red"].id)
+        self.assertEqual(users["bob"].team_id, saved_teams["Blue"].id)
+        self.assertEqual(saved_teams["Red"].captain_id, users["alice"].id)
+        self.assertEqual(saved_teams["Blue"].captain_id, users["bob"].id)
+
+        # A second load creates nothing, and a member already in a team is not moved
+        with self.engine.begin() as conn:
+            self.assertEqual(bulk_load.insert_teams(conn, teams, processes=1), team_ids)
+            self.assertEqual(bulk_load.link_members(conn, [(team_ids["Blue"], user_ids["alice@example.com"])]), 0)
+        self.assertEqual(self.rows(bulk_load.Users.__table__)["alice"].team_id, saved_teams["Red"].id)
+
+
+if __name__ == "__main__":
+    unittest.main()
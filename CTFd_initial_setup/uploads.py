@@ -0,0 +1,172 @@
+import io
+import os
+import json
+import uuid
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Local cache of the files already uploaded to CTFd
+default_cache_path = "upload_cache.json"
+
+# Number of files uploaded in parallel, separate from the JSON API calls
+default_upload_workers = 2
+
+chunk_size = 1024 * 1024
+
+
+class MultipartFileStream:
+    """A multipart/form-data body that reads the file from disk while it is sent.
+
+    requests buffers the whole body in memory when it is given ``files=``;
+    this object is passed as ``data=`` instead, with a known length, so the
+    file is streamed in chunks however large it is.
+    """
+
+    def __init__(self, fields, file_field, file_path):
+        boundary = uuid.uuid4().hex
+        self.content_type = f"multipart/form-data; boundary={boundary}"
+        filename = os.path.basename(file_path).replace('"', "%22")
+
+        head = b""
+        for name, value in fields.items():
+            head += (f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n'
+                     f'{value}\r\n').encode()
+        head += (f'--{boundary}\r\nContent-Disposition: form-data; name="{file_field}"; filename="{filename}"\r\n'
+                 f'Content-Type: application/octet-stream\r\n\r\n').encode()
+        tail = f"\r\n--{boundary}--\r\n".encode()
+
+        self.length = len(head) + os.path.getsize(file_path) + len(tail)
+        self.parts = [io.BytesIO(head), open(file_path, 'rb'), io.BytesIO(tail)]
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+    def read(self, size=-1):
+        data = b""
+        while self.parts and (size < 0 or len(data) < size):
+            chunk = self.parts[0].read(size - len(data) if size >= 0 else -1)
+            if chunk:
+                data += chunk
+            else:
+                self.parts.pop(0).close()
+        return data
+
+    def close(self):
+        for part in self.parts:
+            part.close()
+        self.parts = []
+
+
+class FileDigests:
+    """SHA-256 of local files, computed once per file version.
+
+    Challenges often share the same artifact, so the digest is memoized by
+    path, size and modification time.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.digests = {}
+
+    def get(self, file_path):
+        stat = os.stat(file_path)
+        key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+        with self.lock:
+            if key in self.digests:
+                return self.digests[key]
+        sha256 = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                sha256.update(chunk)
+        digest = sha256.hexdigest()
+        with self.lock:
+            self.digests[key] = digest
+        return digest
+
+
+class UploadCache:
+    """Persistent map of (challenge, file name) to the digest and CTFd file ID uploaded for it"""
+
+    def __init__(self, path=default_cache_path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.entries = json.load(f)
+
+    @staticmethod
+    def key(challenge_id, file_path):
+        return f"{challenge_id}/{os.path.basename(file_path)}"
+
+    def get(self, challenge_id, file_path):
+        with self.lock:
+            return self.entries.get(self.key(challenge_id, file_path))
+
+    def record(self, challenge_id, file_path, digest, file_data):
+        with self.lock:
+            self.entries[self.key(challenge_id, file_path)] = {
+                "digest": digest, "file_id": file_data["id"], "location": file_data.get("location")
+            }
+            self._save()
+
+    def prune(self, live_files):
+        """Drop the entries whose file is no longer on the server.
+
+        IDs restart on a freshly deployed instance, so an entry is only kept
+        when both the file ID and its storage location still match.
+        """
+        live = {(f["id"], f.get("location")) for f in live_files}
+        with self.lock:
+            stale = [k for k, v in self.entries.items() if (v["file_id"], v["location"]) not in live]
+            for k in stale:
+                del self.entries[k]
+            if stale:
+                self._save()
+        return len(stale)
+
+    def _save(self):
+        # Write to a temporary file first so a crash never leaves a truncated cache
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.entries, f)
+        os.replace(tmp_path, self.path)
+
+
+class UploadLane:
+    """Bounded pool dedicated to file uploads, with its digest memo and upload cache.
+
+    Uploads are slow and bandwidth bound; keeping them in their own lane
+    stops a few large files from occupying the workers that send the small
+    JSON calls.
+    """
+
+    def __init__(self, workers=default_upload_workers, cache_path=default_cache_path):
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.digests = FileDigests()
+        self.cache = UploadCache(cache_path)
+
+    def submit(self, fn, *args):
+        return self.pool.submit(fn, *args)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.pool.shutdown()
+
+
+def add_upload_arguments(parser):
+    """Add the --upload-workers and --upload-cache options"""
+    parser.add_argument("--upload-workers", type=int, default=default_upload_workers,
+                        help=f"number of files uploaded in parallel (default: {default_upload_workers})")
+    parser.add_argument("--upload-cache", default=default_cache_path,
+                        help=f"file recording the digests of uploaded files (default: {default_cache_path})")
@@ -0,0 +1,608 @@
+import os
+import re
+import ssl
+import sys
+import json
+import time
+import uuid
+import signal
+import random
+import argparse
+import threading
+import subprocess
+import urllib.request
+from collections import Counter
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Tables of the CTFd stand-in, the ones the provisioning scripts create objects in
+ctfd_tables = ("challenges", "flags", "hints", "files", "users", "teams")
+
+# Largest page CTFd returns on its paginated endpoints
+ctfd_max_page = 100
+
+# Fields of a challenge in the /api/v1/challenges list; the rest only comes with GET /challenges/<id>
+challenge_list_fields = ("id", "type", "name", "value", "solves", "solved_by_me", "category", "tags", "template",
+                         "script")
+
+
+class Faults:
+    """Latency and failures injected into the requests of a stand-in server.
+
+    Every request waits ``latency`` seconds plus up to ``jitter`` more. A
+    ``throttle_rate`` share is answered 429, with a Retry-After header when
+    ``retry_after`` is set, and an ``error_rate`` share 503. Failed requests
+    change nothing on the server, like a proxy refusing them would.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, throttle_rate=0.0, retry_after=None, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.seed = seed
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def draw(self):
+        """Return the delay of a request and the status it fails with, or None"""
+        with self.lock:
+            delay = self.latency + self.random.uniform(0, self.jitter)
+            roll = self.random.random()
+        if roll < self.throttle_rate:
+            return delay, 429
+        if roll < self.throttle_rate + self.error_rate:
+            return delay, 503
+        return delay, None
+
+
+class RequestStats:
+    """Requests a stand-in received, counted per method and route"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.requests = Counter()
+            self.statuses = Counter()
+            self.bytes_received = 0
+            self.bytes_sent = 0
+
+    def record(self, method, route, status, received, sent):
+        with self.lock:
+            self.requests[f"{method} {route}"] += 1
+            self.statuses[str(status)] += 1
+            self.bytes_received += received
+            self.bytes_sent += sent
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "requests": sum(self.requests.values()),
+                "endpoints": dict(self.requests.most_common()),
+                "statuses": dict(sorted(self.statuses.items())),
+                "bytes_received": self.bytes_received,
+                "bytes_sent": self.bytes_sent,
+            }
+
+
+def route_of(path):
+    """Collapse object IDs and UUIDs so requests are counted per endpoint"""
+    return re.sub(r"/(\d+|[0-9a-f]{8}-[0-9a-f-]{27})(?=/|$)", "/<id>", path)
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Dispatches requests to the ``routes`` of a subclass after the injected faults.
+
+    Routes are (method, path regex, method name) tuples; the named method is
+    called with the match, the parsed query and the raw body, and returns a
+    status and a JSON payload (or an HTML string).
+    """
+
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately; without TCP_NODELAY each response waits for a delayed ACK
+    disable_nagle_algorithm = True
+    routes = ()
+
+    def log_message(self, format, *args):
+        pass
+
+    def read_body(self):
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            body = b""
+            while True:
+                size = int(self.rfile.readline().split(b";")[0], 16)
+                chunk = self.rfile.read(size + 2)
+                if not size:
+                    return body
+                body += chunk[:-2]
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def respond(self, status, payload, headers=None):
+        if isinstance(payload, str):
+            data, content_type = payload.encode(), "text/html; charset=utf-8"
+        else:
+            data, content_type = json.dumps(payload).encode(), "application/json"
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+        return len(data)
+
+    def dispatch(self, method):
+        url = urlparse(self.path)
+        body = self.read_body()
+        if url.path.startswith("/_stand_in/"):
+            return self.control(method, url.path, body)
+        delay, fault = self.server.faults.draw()
+        if delay:
+            time.sleep(delay)
+
+        headers = {}
+        if fault:
+            status, payload = fault, {"success": False, "message": "Injected failure"}
+            if fault == 429 and self.server.faults.retry_after is not None:
+                headers["Retry-After"] = str(self.server.faults.retry_after)
+        elif not self.authorized():
+            status, payload = 401, {"success": False, "message": "Unauthorized"}
+        else:
+            status, payload = 404, {"success": False, "message": "Not found"}
+            for route_method, pattern, name in self.routes:
+                match = re.fullmatch(pattern, url.path)
+                if route_method == method and match:
+                    with self.server.lock:
+                        status, payload = getattr(self, name)(match, parse_qs(url.query), body)
+                    break
+        if status in (301, 302):
+            headers["Location"] = "/"
+        sent = self.respond(status, payload, headers)
+        self.server.stats.record(method, route_of(url.path), status, len(body), sent)
+
+    def control(self, method, path, body):
+        """Counts, resets and seeding for the benchmark harness, neither delayed nor counted themselves"""
+        if method == "POST" and path == "/_stand_in/reset":
+            self.server.reset()
+            self.respond(200, {"reset": True})
+        elif method == "POST" and path == "/_stand_in/seed":
+            with self.server.lock:
+                self.seed(json.loads(body or b"{}"))
+                created = self.created(self.server.state)
+            self.respond(200, {"created": created})
+        elif method == "GET" and path == "/_stand_in/stats":
+            with self.server.lock:
+                created = self.created(self.server.state)
+            self.respond(200, {**self.server.stats.snapshot(), "created": created})
+        else:
+            self.respond(404, {"success": False})
+
+    def seed(self, spec):
+        pass
+
+    def authorized(self):
+        return True
+
+    def do_GET(self):
+        self.dispatch("GET")
+
+    def do_POST(self):
+        self.dispatch("POST")
+
+    def do_PATCH(self):
+        self.dispatch("PATCH")
+
+    def do_DELETE(self):
+        self.dispatch("DELETE")
+
+
+class CTFdHandler(StandInHandler):
+    """The parts of the CTFd setup page and REST API used by the provisioning scripts"""
+
+    table = "|".join(ctfd_tables)
+    routes = (
+        ("GET", r"/", "get_index"),
+        ("GET", r"/setup", "get_setup"),
+        ("POST", r"/setup", "post_setup"),
+        ("GET", r"/api/v1/users/me", "get_me"),
+        ("POST", r"/api/v1/files", "post_file"),
+        ("POST", r"/api/v1/teams/(\d+)/members", "post_member"),
+        ("DELETE", r"/api/v1/teams/(\d+)/members", "delete_member"),
+        ("GET", rf"/api/v1/({table})", "get_list"),
+        ("POST", rf"/api/v1/({table})", "post_object"),
+        ("GET", rf"/api/v1/({table})/(\d+)", "get_object"),
+        ("GET", r"/api/v1/challenges/(\d+)/requirements", "get_requirements"),
+        ("GET", r"/api/v1/challenges/(\d+)/files", "get_challenge_files"),
+        ("PATCH", rf"/api/v1/({table})/(\d+)", "patch_object"),
+        ("DELETE", rf"/api/v1/({table})/(\d+)", "delete_object"),
+    )
+
+    @staticmethod
+    def new_state():
+        # Unique emails and names are indexed, so a 10k roster is not checked in quadratic time
+        return {"tables": {name: {} for name in ctfd_tables}, "next_id": Counter(), "setup": False,
+                "emails": set(), "names": {"users": set(), "teams": set()}}
+
+    @staticmethod
+    def created(state):
+        return {name: len(table) for name, table in state["tables"].items() if table}
+
+    def authorized(self):
+        """Every API request needs a token, and like CTFd it only counts on JSON requests.
+
+        The one exception is the file upload, a POST to /api/v1/files, which
+        is multipart. Body-less GET and DELETE requests still send the JSON
+        content type, as ctfd_client sessions do.
+        """
+        if not self.path.startswith("/api/"):
+            return True
+        if not self.headers.get("Authorization", "").startswith("Token "):
+            return False
+        content_type = self.headers.get("Content-Type", "").split(";")[0].strip()
+        if self.command == "POST" and urlparse(self.path).path == "/api/v1/files":
+            return content_type == "multipart/form-data"
+        return content_type == "application/json"
+
+    def new_object(self, table, fields):
+        state = self.server.state
+        if table in state["names"]:
+            state["names"][table].add(fields.get("name"))
+        if table == "users":
+            state["emails"].add(fields.get("email", "").lower())
+        state["next_id"][table] += 1
+        obj = {**fields, "id": state["next_id"][table]}
+        state["tables"][table][obj["id"]] = obj
+        return obj
+
+    def seed(self, spec):
+        """Fill the instance as the provisioning scripts would: an admin, challenges with their
+        flag and two hints, and ``users`` users in teams of ``team_size``"""
+        self.new_object("users", {"name": "admin", "email": "admin@example.com", "type": "admin", "team_id": None})
+        for i in range(spec.get("challenges", 0)):
+            challenge = self.new_object("challenges", {"name": f"Seeded challenge {i}", "type": "standard"})
+            self.new_object("flags", {"challenge_id": challenge["id"], "content": f"flag{{{i}}}", "type": "static"})
+            for cost in (10, 20):
+                self.new_object("hints", {"challenge_id": challenge["id"], "cost": cost})
+        team = None
+        for i in range(spec.get("users", 0)):
+            if i % spec.get("team_size", 4) == 0:
+                team = self.new_object("teams", {"name": f"Seeded team {i}"})
+            user = self.new_object("users", {"name": f"seeded{i}", "email": f"seeded{i}@example.com",
+                                             "type": "user", "team_id": team["id"]})
+            team.setdefault("captain_id", user["id"])
+
+    def get_index(self, match, query, body):
+        return 200, "<html><body>CTFd</body></html>"
+
+    def get_setup(self, match, query, body):
+        if self.server.state["setup"]:
+            return 302, ""
+        return 200, ('<form method="post"><input id="nonce" name="nonce" type="hidden" '
+                     f'value="{uuid.uuid4().hex}"></form>')
+
+    def post_setup(self, match, query, body):
+        self.server.state["setup"] = True
+        return 302, ""
+
+    def get_me(self, match, query, body):
+        return 200, {"success": True, "data": {"id": 1, "name": "admin"}}
+
+    def get_list(self, match, query, body):
+        items = list(self.server.state["tables"][match.group(1)].values())
+        if match.group(1) == "challenges":
+            items = [{"solves": 0, "solved_by_me": False, "tags": [], "template": "", "script": "",
+                      **{key: value for key, value in item.items() if key in challenge_list_fields}}
+                     for item in items]
+        if match.group(1) not in ("users", "teams"):
+            return 200, {"success": True, "data": items}
+        if "q" in query:
+            # The admin search: a case-insensitive substring match on one field
+            field, q = query.get("field", ["name"])[0], query["q"][0].lower()
+            items = [item for item in items if q in str(item.get(field, "")).lower()]
+        page = int(query.get("page", ["1"])[0])
+        size = min(int(query.get("per_page", ["50"])[0]), ctfd_max_page)
+        data = items[(page - 1) * size:page * size]
+        return 200, {"success": True, "data": data, "meta": {"pagination": {
+            "page": page, "next": page + 1 if page * size < len(items) else None, "per_page": size,
+            "total": len(items)}}}
+
+    def post_object(self, match, query, body):
+        table = match.group(1)
+        fields = json.loads(body or b"{}")
+        state = self.server.state
+        if table == "users" and fields.get("email", "").lower() in state["emails"]:
+            return 400, {"success": False, "errors": {"email": ["That email has already been used"]}}
+        if table in state["names"] and fields.get("name") in state["names"][table]:
+            return 400, {"success": False, "errors": {"name": ["That name is already taken"]}}
+        if table == "users":
+            fields.pop("password", None)
+            fields["team_id"] = None
+        return 200, {"success": True, "data": self.new_object(table, fields)}
+
+    def post_file(self, match, query, body):
+        filename = re.search(rb'filename="([^"]*)"', body)
+        challenge = re.search(rb'name="challenge_id"\r\n\r\n(\d+)', body)
+        if not filename:
+            return 400, {"success": False, "errors": {"file": ["No file"]}}
+        obj = self.new_object("files", {
+            "type": "challenge", "challenge_id": int(challenge.group(1)) if challenge else None,
+            "location": f"{uuid.uuid4().hex}/{filename.group(1).decode()}",
+        })
+        return 200, {"success": True, "data": [obj]}
+
+    def get_object(self, match, query, body):
+        obj = self.server.state["tables"][match.group(1)].get(int(match.group(2)))
+        if obj is None:
+            return 404, {"success": False}
+        if match.group(1) == "challenges":
+            # CTFd serves the requirements of a challenge on their own endpoint
+            obj = {key: value for key, value in obj.items() if key != "requirements"}
+        return 200, {"success": True, "data": obj}
+
+    def get_requirements(self, match, query, body):
+        obj = self.server.state["tables"]["challenges"].get(int(match.group(1)))
+        if obj is None:
+            return 404, {"success": False}
+        return 200, {"success": True, "data": obj.get("requirements")}
+
+    def get_challenge_files(self, match, query, body):
+        if int(match.group(1)) not in self.server.state["tables"]["challenges"]:
+            return 404, {"success": False}
+        return 200, {"success": True, "data": [
+            {key: f[key] for key in ("id", "type", "location")}
+            for f in self.server.state["tables"]["files"].values() if f.get("challenge_id") == int(match.group(1))]}
+
+    def patch_object(self, match, query, body):
+        obj = self.server.state["tables"][match.group(1)].get(int(match.group(2)))
+        if obj is None:
+            return 404, {"success": False}
+        obj.update(json.loads(body or b"{}"))
+        return 200, {"success": True, "data": obj}
+
+    def delete_object(self, match, query, body):
+        state = self.server.state
+        obj = state["tables"][match.group(1)].pop(int(match.group(2)), None)
+        if obj is None:
+            return 404, {"success": False}
+        state["names"].get(match.group(1), set()).discard(obj.get("name"))
+        if match.group(1) == "users":
+            state["emails"].discard(obj.get("email", "").lower())
+        return 200, {"success": True}
+
+    def post_member(self, match, query, body):
+        team = self.server.state["tables"]["teams"].get(int(match.group(1)))
+        user = self.server.state["tables"]["users"].get(json.loads(body or b"{}").get("user_id"))
+        if team is None or user is None:
+            return 404, {"success": False}
+        if user["team_id"] is not None:
+            return 400, {"success": False, "errors": {"id": ["User has already joined a team"]}}
+        user["team_id"] = team["id"]
+        team.setdefault("captain_id", user["id"])
+        return 200, {"success": True, "data": [user["id"]]}
+
+    def delete_member(self, match, query, body):
+        user = self.server.state["tables"]["users"].get(json.loads(body or b"{}").get("user_id"))
+        if user is None or user["team_id"] != int(match.group(1)):
+            return 400, {"success": False, "errors": {"id": ["User is not part of this team"]}}
+        user["team_id"] = None
+        return 200, {"success": True, "data": []}
+
+
+class OPNsenseHandler(StandInHandler):
+    """The OPNsense WireGuard API calls made by wireguard.py"""
+
+    routes = (
+        ("GET", r"/api/wireguard/server/get", "get_server"),
+        ("GET", r"/api/wireguard/client/searchClient", "search_clients"),
+        ("POST", r"/api/wireguard/client/searchClient", "search_clients"),
+        ("POST", r"/api/wireguard/client/addClient", "add_client"),
+        ("POST", r"/api/wireguard/client/setClient/([\w-]+)", "set_client"),
+        ("POST", r"/api/wireguard/client/delClient/([\w-]+)", "del_client"),
+        ("POST", r"/api/wireguard/service/reconfigure", "reconfigure"),
+        ("POST", r"/api/core/system/reboot", "reboot"),
+    )
+
+    @staticmethod
+    def new_state():
+        return {"server": str(uuid.uuid4()), "clients": {}, "names": set(), "addresses": set(), "reconfigures": 0}
+
+    @staticmethod
+    def created(state):
+        return {"clients": len(state["clients"]), "reconfigures": state["reconfigures"]}
+
+    def authorized(self):
+        return self.headers.get("Authorization", "").startswith("Basic ")
+
+    def get_server(self, match, query, body):
+        return 200, {"server": {"servers": {"server": {self.server.state["server"]: {"name": "ctfd"}}}}}
+
+    def search_clients(self, match, query, body):
+        if body:
+            query = {key: [str(value)] for key, value in json.loads(body).items()}
+        rows = list(self.server.state["clients"].values())
+        if query.get("searchPhrase", [""])[0]:
+            # The bootgrid search: a case-insensitive substring match on the listed fields
+            phrase = query["searchPhrase"][0].lower()
+            rows = [row for row in rows if any(phrase in str(value).lower() for value in row.values())]
+        current = int(query.get("current", ["1"])[0])
+        size = int(query.get("rowCount", ["25"])[0])
+        page = rows[(current - 1) * size:current * size]
+        return 200, {"rows": page, "rowCount": len(page), "total": len(rows), "current": current}
+
+    def add_client(self, match, query, body):
+        client = json.loads(body or b"{}").get("client", {})
+        state = self.server.state
+        # OPNsense validates the fields and answers 200 either way
+        if not client.get("name") or client["name"] in state["names"]:
+            return 200, {"result": "failed", "validations": {"client.name": "A client with this name exists."}}
+        if client.get("tunneladdress") in state["addresses"]:
+            return 200, {"result": "failed", "validations": {"client.tunneladdress": "Address in use."}}
+        client["uuid"] = str(uuid.uuid4())
+        state["clients"][client["uuid"]] = client
+        state["names"].add(client["name"])
+        state["addresses"].add(client.get("tunneladdress"))
+        return 200, {"result": "saved", "uuid": client["uuid"]}
+
+    def set_client(self, match, query, body):
+        client = self.server.state["clients"].get(match.group(1))
+        if client is None:
+            return 200, {"result": "failed"}
+        client.update(json.loads(body or b"{}").get("client", {}))
+        return 200, {"result": "saved"}
+
+    def del_client(self, match, query, body):
+        state = self.server.state
+        client = state["clients"].pop(match.group(1), None)
+        if client is None:
+            return 200, {"result": "not found"}
+        state["names"].discard(client["name"])
+        state["addresses"].discard(client.get("tunneladdress"))
+        return 200, {"result": "deleted"}
+
+    def reconfigure(self, match, query, body):
+        self.server.state["reconfigures"] += 1
+        return 200, {"status": "ok"}
+
+    def reboot(self, match, query, body):
+        return 200, {"status": "ok"}
+
+
+class StandInServer(ThreadingHTTPServer):
+    """Threaded HTTPS server holding the state, faults and request counts of a stand-in"""
+
+    daemon_threads = True
+
+    def __init__(self, handler_class, certificate, faults=None, port=0):
+        super().__init__(("127.0.0.1", port), handler_class)
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(*certificate)
+        # The handshake runs in the handler thread, not in the accept loop
+        self.socket = context.wrap_socket(self.socket, server_side=True, do_handshake_on_connect=False)
+        self.faults = faults or Faults()
+        self.stats = RequestStats()
+        self.lock = threading.Lock()
+        self.state = handler_class.new_state()
+
+    @property
+    def url(self):
+        return f"https://127.0.0.1:{self.server_address[1]}"
+
+    @property
+    def address(self):
+        return f"127.0.0.1:{self.server_address[1]}"
+
+    def reset(self):
+        """Forget the objects created and the requests counted so far"""
+        with self.lock:
+            self.state = self.RequestHandlerClass.new_state()
+        self.stats.reset()
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+def self_signed_certificate(directory):
+    """Create a throwaway certificate for 127.0.0.1 with openssl, returning (cert, key) paths"""
+    cert, key = os.path.join(directory, "stand_in.crt"), os.path.join(directory, "stand_in.key")
+    if not os.path.exists(cert):
+        subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+                        "-subj", "/CN=127.0.0.1", "-keyout", key, "-out", cert],
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+    return cert, key
+
+
+def add_fault_arguments(parser):
+    """Add the options configuring the injected latency and failures"""
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every request (default: 0)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="up to this many more seconds (default: 0)")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="share of requests answered 503, e.g. 0.01 (default: 0)")
+    parser.add_argument("--throttle-rate", type=float, default=0.0,
+                        help="share of requests answered 429, e.g. 0.02 (default: 0)")
+    parser.add_argument("--retry-after", type=int, default=None,
+                        help="Retry-After seconds sent with the 429 responses (default: none)")
+    parser.add_argument("--seed", type=int, default=None, help="seed of the injected failures, for repeatable runs")
+
+
+def faults_from_args(args):
+    return Faults(args.latency, args.jitter, args.error_rate, args.throttle_rate, args.retry_after, args.seed)
+
+
+def fault_argv(faults):
+    """The command line options starting a stand-in with the same ``faults``"""
+    argv = ["--latency", str(faults.latency), "--jitter", str(faults.jitter), "--error-rate", str(faults.error_rate),
+            "--throttle-rate", str(faults.throttle_rate)]
+    for option, value in (("--retry-after", faults.retry_after), ("--seed", faults.seed)):
+        if value is not None:
+            argv += [option, str(value)]
+    return argv
+
+
+class StandInProcess:
+    """Both stand-ins in a child process, so they do not compete with the measured script for the GIL"""
+
+    def __init__(self, cert_dir, argv=()):
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--ctfd-port", "0", "--opnsense-port", "0",
+             "--cert-dir", cert_dir, *argv], stdout=subprocess.PIPE, text=True)
+        ports = re.findall(r"https://127\.0\.0\.1:(\d+)", self.process.stdout.readline())
+        if len(ports) != 2:
+            self.process.kill()
+            raise RuntimeError("The stand-in servers did not start")
+        self.ctfd, self.opnsense = (StandInClient(int(port)) for port in ports)
+
+    def close(self):
+        self.process.terminate()
+        self.process.wait()
+
+
+class StandInClient:
+    """Address of a running stand-in and access to its counts"""
+
+    def __init__(self, port):
+        self.port = port
+        self.url = f"https://127.0.0.1:{port}"
+        self.address = f"127.0.0.1:{port}"
+        self.context = ssl._create_unverified_context()
+
+    def call(self, method, path, payload=None):
+        request = urllib.request.Request(f"{self.url}/_stand_in/{path}", method=method,
+                                         data=json.dumps(payload).encode() if payload is not None else None)
+        with urllib.request.urlopen(request, context=self.context) as response:
+            return json.load(response)
+
+    def reset(self):
+        self.call("POST", "reset")
+
+    def stats(self):
+        return self.call("GET", "stats")
+
+    def seed(self, **spec):
+        return self.call("POST", "seed", spec)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the CTFd and OPNsense stand-ins until interrupted")
+    parser.add_argument("--ctfd-port", type=int, default=8443, help="CTFd stand-in port (default: 8443)")
+    parser.add_argument("--opnsense-port", type=int, default=9443, help="OPNsense stand-in port (default: 9443)")
+    parser.add_argument("--cert-dir", default=".", help="directory of the self-signed certificate (default: .)")
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+    certificate = self_signed_certificate(args.cert_dir)
+    ctfd = StandInServer(CTFdHandler, certificate, faults_from_args(args), args.ctfd_port).start()
+    opnsense = StandInServer(OPNsenseHandler, certificate, faults_from_args(args), args.opnsense_port).start()
+    print(f"CTFd stand-in on {ctfd.url}, OPNsense stand-in on {opnsense.url} (DNS = {opnsense.address})",
+          flush=True)
+    # Stopped with Ctrl+C, or terminated by the benchmark harness
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        for server in (ctfd, opnsense):
+            print(f"{server.RequestHandlerClass.__name__}: {json.dumps(server.stats.snapshot())}")
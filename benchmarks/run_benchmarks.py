@@ -0,0 +1,230 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import contextlib
+import subprocess
+
+benchmarks_dir = os.path.dirname(os.path.abspath(__file__))
+setup_dir = os.path.join(os.path.dirname(benchmarks_dir), "CTFd_initial_setup")
+wireguard_dir = os.path.join(os.path.dirname(benchmarks_dir), "wireguard_peers_add")
+sys.path[:0] = [setup_dir, wireguard_dir]
+
+import challenges
+import add_user
+import add_team_and_user
+import wireguard
+import teardown
+from instrumentation import collector, progress
+
+import synthetic
+from mock_servers import StandInProcess, add_fault_arguments, faults_from_args, fault_argv
+
+default_scales = "10,1000,10000"
+default_scripts = "ctfd_setup,challenges,add_user,add_team_and_user,wireguard,teardown"
+
+# A run is a regression when its rows/sec drop more than this below the baseline
+default_tolerance = 0.2
+
+token = "benchmark-token"
+
+
+def prepare_wireguard(workdir, scale, opnsense):
+    """users.csv, apikey.txt and wireguard.conf pointing the script at the OPNsense stand-in"""
+    directory = os.path.join(workdir, "wireguard")
+    os.makedirs(directory, exist_ok=True)
+    synthetic.write_users(directory, scale)
+    with open(os.path.join(directory, "apikey.txt"), 'w') as f:
+        f.write("key=benchmark\nsecret=benchmark\n")
+    with open(os.path.join(wireguard_dir, "wireguard.conf")) as template, \
+            open(os.path.join(directory, "wireguard.conf"), 'w') as f:
+        for line in template:
+            # wireguard.py talks to the firewall at the DNS address of the template
+            f.write(f"DNS = {opnsense.address}\n" if line.startswith("DNS") else line)
+    return directory
+
+
+def prepare_teardown(workdir, scale, ctfd):
+    """An instance with ``scale`` users in teams of 4 and a challenge per 10 users"""
+    ctfd.seed(users=scale, challenges=max(1, scale // 10), team_size=4)
+
+
+def run_ctfd_setup(prepared, workdir, ctfd):
+    # ctfd_setup.py runs at import, so it is timed as a process, interpreter start included
+    subprocess.run([sys.executable, os.path.join(setup_dir, "ctfd_setup.py"), "teams", "admin",
+                    "admin@example.com", "benchmark", ctfd.url], stdout=sys.stdout, check=True)
+
+
+def run_challenges(prepared, workdir, ctfd):
+    challenges.main(token, journal_path=os.path.join(workdir, "journal.db"),
+                    upload_cache=os.path.join(workdir, "upload_cache.json"), url=ctfd.url, csv_path=prepared)
+
+
+def run_add_user(prepared, workdir, ctfd):
+    add_user.main(token, journal_path=os.path.join(workdir, "journal.db"), url=ctfd.url, roster_path=prepared,
+                  mail_database=os.path.join(workdir, "accounts_mail_database.csv"))
+
+
+def run_add_team_and_user(prepared, workdir, ctfd):
+    add_team_and_user.main(token, journal_path=os.path.join(workdir, "journal.db"), url=ctfd.url,
+                           roster_path=prepared, mail_database=os.path.join(workdir, "accounts_mail_database.csv"))
+
+
+def run_wireguard(prepared, workdir, opnsense):
+    cwd = os.getcwd()
+    os.chdir(prepared)
+    try:
+        wireguard.main(tunnel_network="10.13.0.0/16", output_path="wireguard_configs.zip")
+    finally:
+        os.chdir(cwd)
+
+
+def run_teardown(prepared, workdir, ctfd):
+    teardown.main(token, peers=False, journal_path=os.path.join(workdir, "journal.db"), yes=True, url=ctfd.url)
+
+
+# Script name: (server it talks to, input preparation, run); ctfd_setup has no rows and runs once
+benchmarks = {
+    "ctfd_setup": ("ctfd", None, run_ctfd_setup),
+    "challenges": ("ctfd", lambda workdir, scale, server: synthetic.write_challenges(workdir, scale),
+                   run_challenges),
+    "add_user": ("ctfd", lambda workdir, scale, server: synthetic.write_users(workdir, scale), run_add_user),
+    "add_team_and_user": ("ctfd", lambda workdir, scale, server: synthetic.write_teams(workdir, scale),
+                          run_add_team_and_user),
+    "wireguard": ("opnsense", prepare_wireguard, run_wireguard),
+    "teardown": ("ctfd", prepare_teardown, run_teardown),
+}
+
+
+def run_benchmark(name, scale, servers, workdir, verbose=False):
+    """Run one script against a fresh stand-in and return its measurements"""
+    server_name, prepare, run = benchmarks[name]
+    server = servers[server_name]
+    run_dir = os.path.join(workdir, f"{name}-{scale}")
+    os.makedirs(run_dir, exist_ok=True)
+    server.reset()
+    # Input files and seeded objects are made before the clock starts
+    prepared = prepare(run_dir, scale, server) if prepare else None
+    collector.reset()
+    progress.start(interval=0)
+
+    error = None
+    start = time.perf_counter()
+    try:
+        with open(os.devnull, 'w') as devnull, \
+                contextlib.nullcontext() if verbose else contextlib.redirect_stdout(devnull):
+            run(prepared, run_dir, server)
+    except SystemExit as e:
+        error = f"exit {e.code}" if e.code else None
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    seconds = time.perf_counter() - start
+    progress.close()
+
+    stats = server.stats()
+    return {
+        "script": name,
+        "scale": scale,
+        "seconds": round(seconds, 3),
+        "requests": stats["requests"],
+        "requests_per_sec": round(stats["requests"] / seconds, 1) if seconds else 0.0,
+        "rows_per_sec": round(scale / seconds, 1) if seconds else 0.0,
+        "statuses": stats["statuses"],
+        "endpoints": stats["endpoints"],
+        "request_bytes": stats["bytes_received"],
+        "response_bytes": stats["bytes_sent"],
+        "created": stats["created"],
+        # As seen by the script: latency histograms per endpoint, retries included, and row outcomes
+        "client_endpoints": collector.summary(),
+        "rows": {kind: dict(counts) for kind, counts in progress.counts.items()},
+        "error": error,
+    }
+
+
+def print_results(results):
+    print(f"{'script':<18} {'scale':>6} {'seconds':>9} {'requests':>9} {'req/s':>8} {'rows/s':>8} "
+          f"{'429':>5} {'5xx':>5}  created")
+    for r in results:
+        server_errors = sum(count for status, count in r["statuses"].items() if status.startswith("5"))
+        created = ", ".join(f"{count} {name}" for name, count in r["created"].items())
+        print(f"{r['script']:<18} {r['scale']:>6} {r['seconds']:>9.2f} {r['requests']:>9} "
+              f"{r['requests_per_sec']:>8.1f} {r['rows_per_sec']:>8.1f} {r['statuses'].get('429', 0):>5} "
+              f"{server_errors:>5}  {created}" + (f"  [{r['error']}]" if r["error"] else ""))
+
+
+def compare(results, baseline, tolerance=default_tolerance):
+    """Print the throughput change against a previous run, returning the regressed (script, scale) pairs"""
+    previous = {(r["script"], r["scale"]): r for r in baseline["results"]}
+    if baseline.get("faults") != results["faults"]:
+        print("Warning: the baseline was measured with other injected faults.")
+    regressions = []
+    print(f"\nAgainst the baseline (regression below -{tolerance:.0%} rows/sec):")
+    for r in results["results"]:
+        before = previous.get((r["script"], r["scale"]))
+        if not before or not before["rows_per_sec"]:
+            continue
+        change = r["rows_per_sec"] / before["rows_per_sec"] - 1
+        regressed = change < -tolerance
+        if regressed:
+            regressions.append((r["script"], r["scale"]))
+        print(f"  {r['script']:<18} {r['scale']:>6} {before['rows_per_sec']:>8.1f} -> {r['rows_per_sec']:>8.1f} "
+              f"rows/s ({change:+.0%}){'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def main(scripts, scales, faults, output_path=None, baseline_path=None, tolerance=default_tolerance,
+         workdir=None, verbose=False):
+    with contextlib.ExitStack() as stack:
+        if workdir is None:
+            workdir = stack.enter_context(tempfile.TemporaryDirectory(prefix="ctfd_benchmark_"))
+        os.makedirs(workdir, exist_ok=True)
+        stand_ins = StandInProcess(workdir, fault_argv(faults))
+        stack.callback(stand_ins.close)
+        servers = {"ctfd": stand_ins.ctfd, "opnsense": stand_ins.opnsense}
+        results = []
+        for name in scripts:
+            for scale in ([1] if benchmarks[name][1] is None else scales):
+                print(f"Running {name} with {scale} rows...", flush=True)
+                results.append(run_benchmark(name, scale, servers, workdir, verbose))
+
+    print()
+    print_results(results)
+    summary = {"faults": {key: getattr(faults, key) for key in
+                          ("latency", "jitter", "error_rate", "throttle_rate", "retry_after", "seed")},
+               "results": results}
+    if output_path:
+        with open(output_path, 'w') as f:
+            json.dump(summary, f, indent=2)
+        print(f"\nResults written to {output_path}.")
+
+    failed = any(r["error"] for r in results)
+    if baseline_path:
+        with open(baseline_path) as f:
+            failed = bool(compare(summary, json.load(f), tolerance)) or failed
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time the provisioning scripts against local CTFd and OPNsense "
+                                                 "stand-ins with synthetic CSV files")
+    parser.add_argument("--scripts", default=default_scripts,
+                        help=f"comma-separated scripts to run (default: {default_scripts})")
+    parser.add_argument("--scales", default=default_scales,
+                        help=f"comma-separated numbers of CSV rows (default: {default_scales})")
+    parser.add_argument("--output", help="write the measurements to this JSON file")
+    parser.add_argument("--baseline", help="JSON file of a previous run to compare rows/sec against")
+    parser.add_argument("--tolerance", type=float, default=default_tolerance,
+                        help=f"rows/sec drop counted as a regression (default: {default_tolerance})")
+    parser.add_argument("--workdir", help="keep the generated CSVs, journals and configs in this directory")
+    parser.add_argument("--verbose", action="store_true", help="show the output of the scripts")
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+    scripts = args.scripts.split(",")
+    unknown = [name for name in scripts if name not in benchmarks]
+    if unknown:
+        print(f"Unknown scripts: {', '.join(unknown)} (choose from {', '.join(benchmarks)})")
+        sys.exit(1)
+    sys.exit(main(scripts, [int(scale) for scale in args.scales.split(",")], faults_from_args(args), args.output,
+                  args.baseline, args.tolerance, args.workdir, args.verbose))
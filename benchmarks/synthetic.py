@@ -0,0 +1,82 @@
+import os
+import csv
+import random
+
+challenge_fields = ["Name", "Category", "Description", "Max Attempts", "State", "Type", "Connection_Info", "Value",
+                    "Initial", "Decay", "Minimum", "First_Blood_Bonus", "Flag_Type", "Flag", "Hints", "Hints_Cost",
+                    "Challenge_Prerequisites", "File_Path"]
+categories = ["Web", "Linux", "Crypto", "Forensics", "Pwn"]
+
+# Every n-th challenge has an attachment, every m-th is locked behind the previous one
+file_every = 5
+prerequisite_every = 10
+file_size = 4096
+
+# Members per team of team_and_users.csv
+team_size = 4
+
+
+def write_challenges(directory, count, seed=0):
+    """Write challenges.csv with ``count`` challenges, their hint chains, flags and attachments"""
+    rng = random.Random(seed)
+    files_dir = os.path.join(directory, "files")
+    os.makedirs(files_dir, exist_ok=True)
+    path = os.path.join(directory, "challenges.csv")
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=challenge_fields)
+        writer.writeheader()
+        for i in range(1, count + 1):
+            dynamic = i % 3 == 0
+            file_path = ""
+            if i % file_every == 0:
+                file_path = os.path.join(files_dir, f"challenge{i}.bin")
+                with open(file_path, 'wb') as attachment:
+                    attachment.write(rng.randbytes(file_size))
+            writer.writerow({
+                "Name": f"Challenge {i}",
+                "Category": categories[i % len(categories)],
+                "Description": f"Synthetic challenge {i}.",
+                "Max Attempts": 5,
+                "State": "visible",
+                "Type": "dynamic" if dynamic else "standard",
+                "Connection_Info": f"nc 10.10.{i // 250 % 250}.{i % 250} 1337",
+                "Value": 100,
+                "Initial": 500 if dynamic else "",
+                "Decay": 20 if dynamic else "",
+                "Minimum": 50 if dynamic else "",
+                "First_Blood_Bonus": "",
+                "Flag_Type": "static",
+                "Flag": f"flag{{synthetic_{i}_{rng.getrandbits(32):08x}}}",
+                "Hints": f"Hint {i}.1|Hint {i}.2",
+                "Hints_Cost": "10|20",
+                "Challenge_Prerequisites": f"Challenge {i - 1}" if i % prerequisite_every == 0 else "",
+                "File_Path": file_path,
+            })
+    return path
+
+
+def write_users(directory, count, seed=0):
+    """Write users.csv (username, email, password) with ``count`` users"""
+    rng = random.Random(seed)
+    path = os.path.join(directory, "users.csv")
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["username", "email", "password"])
+        for i in range(1, count + 1):
+            writer.writerow([f"user{i}", f"user{i}@example.com", f"{rng.getrandbits(64):016x}"])
+    return path
+
+
+def write_teams(directory, count, seed=0):
+    """Write team_and_users.csv with ``count`` users in teams of ``team_size``"""
+    rng = random.Random(seed)
+    path = os.path.join(directory, "team_and_users.csv")
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["team", "team_password", "members"])
+        for team in range(1, -(-count // team_size) + 1):
+            members = []
+            for i in range((team - 1) * team_size + 1, min(team * team_size, count) + 1):
+                members += [f"member{i}", f"{rng.getrandbits(64):016x}", f"member{i}@example.com"]
+            writer.writerow([f"Team {team}", f"{rng.getrandbits(64):016x}", "|".join(members)])
+    return path
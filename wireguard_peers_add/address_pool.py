@@ -0,0 +1,83 @@
+from ipaddress import ip_interface, ip_network
+
+
+class PoolExhausted(Exception):
+    """Raised when every address of the tunnel network is in use"""
+
+
+class TunnelAddressPool:
+    """Allocates dual-stack tunnel addresses from a bitmap of used host offsets.
+
+    Offset N maps to the N-th address of the IPv4 network and, when an IPv6
+    network is given, to the N-th address of that network too, so a peer
+    always gets a matching pair (10.13.14.5 and fd01::5 in a /24 pool). An
+    offset is used as soon as either of its addresses is. The bitmap takes
+    one bit per IPv4 address, a /16 fits in 8 KiB.
+    """
+
+    def __init__(self, network, network6=None):
+        self.network = ip_network(network, strict=False)
+        self.network6 = ip_network(network6, strict=False) if network6 else None
+        self.size = self.network.num_addresses
+        if self.network6 and self.network6.num_addresses < self.size:
+            raise ValueError(f"{self.network6} is smaller than {self.network}")
+        self.bitmap = bytearray((self.size + 7) // 8)
+        self.cursor = 0
+
+        # The network and broadcast addresses are never handed out
+        if self.network.prefixlen < 31:
+            self.mark_offset(0)
+            self.mark_offset(self.size - 1)
+
+    def mark_offset(self, offset):
+        if 0 <= offset < self.size:
+            self.bitmap[offset >> 3] |= 1 << (offset & 7)
+
+    def mark_range(self, first_offset, last_offset):
+        """Reserve every offset from ``first_offset`` to ``last_offset`` included"""
+        for offset in range(max(first_offset, 0), min(last_offset + 1, self.size)):
+            self.mark_offset(offset)
+
+    def offset_of(self, address):
+        """Offset of an address inside the pool, or None when it lies outside"""
+        address = ip_interface(address).ip
+        for network in (self.network, self.network6):
+            if network and address.version == network.version and address in network:
+                return int(address) - int(network.network_address)
+        return None
+
+    def mark_used(self, tunneladdress):
+        """Mark the addresses of a comma-separated tunnel address list as used"""
+        for address in tunneladdress.split(","):
+            address = address.strip()
+            if address:
+                offset = self.offset_of(address)
+                if offset is not None:
+                    self.mark_offset(offset)
+
+    def allocate(self):
+        """Return the next free tunnel address list, e.g. '10.13.14.5/32,fd01::5/128'.
+
+        The cursor only moves forward and skips full bytes, so allocating all
+        addresses of the pool costs O(1) amortized per peer.
+        """
+        while self.cursor < self.size:
+            byte = self.bitmap[self.cursor >> 3]
+            if byte == 0xFF:
+                self.cursor = (self.cursor | 7) + 1
+                continue
+            offset = self.cursor
+            self.cursor += 1
+            if not byte & (1 << (offset & 7)):
+                self.mark_offset(offset)
+                return self.format(offset)
+        raise PoolExhausted(f"No free address left in {self.network}")
+
+    def format(self, offset):
+        tunneladdress = f"{self.network.network_address + offset}/{self.network.max_prefixlen}"
+        if self.network6:
+            tunneladdress += f",{self.network6.network_address + offset}/{self.network6.max_prefixlen}"
+        return tunneladdress
+
+    def free_count(self):
+        return self.size - sum(bin(byte).count("1") for byte in self.bitmap)
@@ -0,0 +1,172 @@
+import io
+import os
+import time
+import tarfile
+import zipfile
+
+# Default output: one file per client under ./wireguard/
+default_output = "./wireguard"
+
+
+class ConfigTemplate:
+    """wireguard.conf compiled once into literal text and substitution slots.
+
+    The PrivateKey, Address and PresharedKey lines become slots; the text
+    between them is joined in advance, so rendering a client config is a
+    single join instead of a scan of every template line.
+    """
+
+    slots = (("PrivateKey", "privkey"), ("Address", "tunneladdress"), ("PresharedKey", "psk"))
+
+    def __init__(self, lines):
+        self.parts = []
+        literal = ""
+        for line in lines:
+            # Same matching order as before: PrivateKey, then Address, then PresharedKey
+            slot = next(((key, field) for key, field in self.slots if key in line), None)
+            if slot is None:
+                literal += line
+                continue
+            self.parts.append(literal + f"{slot[0]} = ")
+            self.parts.append(slot[1])
+            literal = "\n"
+        self.parts.append(literal)
+
+    def render(self, privkey, tunneladdress, psk):
+        values = {"privkey": privkey, "tunneladdress": tunneladdress, "psk": psk}
+        return "".join(values[part] if i % 2 else part for i, part in enumerate(self.parts))
+
+
+class DirectoryWriter:
+    """Writes every client config to its own file"""
+
+    def __init__(self, path=default_output):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def config_name(self, username):
+        return f"{self.path}/wg-ctfd-{username}.conf"
+
+    def has_config(self, username):
+        return os.path.exists(self.config_name(username))
+
+    def write_config(self, username, text):
+        config_path = self.config_name(username)
+        with open(config_path, 'w') as tempfile:
+            tempfile.write(text)
+        return config_path
+
+    def write_index(self, name, text):
+        pass
+
+    def close(self):
+        pass
+
+
+archive_extensions = (".zip", ".tar", ".tar.gz", ".tgz")
+
+
+def backup_path(path):
+    """``path`` with a timestamp before its extension, e.g. configs-20240101-120000.zip"""
+    extension = next(e for e in (".tar.gz", ".tgz", ".tar", ".zip") if path.endswith(e))
+    stem, stamp = path[:-len(extension)], time.strftime("%Y%m%d-%H%M%S")
+    candidate, n = f"{stem}-{stamp}{extension}", 1
+    while os.path.exists(candidate):
+        n += 1
+        candidate = f"{stem}-{stamp}-{n}{extension}"
+    return candidate
+
+
+def archive_members(path):
+    if path.endswith(".zip"):
+        with zipfile.ZipFile(path) as archive:
+            return set(archive.namelist())
+    with tarfile.open(path) as archive:
+        return set(archive.getnames())
+
+
+class ArchiveWriter:
+    """Streams every client config into a single zip or tar archive.
+
+    Members are added one at a time straight to the archive file, so memory
+    stays bounded however many clients there are, and distributing the
+    configs means copying one file.
+
+    An archive of an earlier run holds the only copy of its peers' private
+    keys, so it is never overwritten: it is renamed to a timestamped backup
+    and its configs that this run does not replace are copied into the new
+    archive. Nothing is touched when the run writes nothing.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.previous = archive_members(path) if os.path.exists(path) else set()
+        self.backup = None
+        self.archive = None
+        self.written = set()
+
+    @staticmethod
+    def config_name(username):
+        return f"wg-ctfd-{username}.conf"
+
+    def has_config(self, username):
+        return self.config_name(username) in self.previous
+
+    def open(self):
+        if os.path.exists(self.path):
+            self.backup = backup_path(self.path)
+            os.rename(self.path, self.backup)
+            print(f"Previous configs kept in {self.backup}.")
+        if self.path.endswith(".zip"):
+            self.archive = zipfile.ZipFile(self.path, 'w', compression=zipfile.ZIP_DEFLATED)
+        else:
+            self.archive = tarfile.open(self.path, "w:gz" if self.path.endswith((".tar.gz", ".tgz")) else "w")
+
+    def add(self, name, text):
+        if self.archive is None:
+            self.open()
+        self.written.add(name)
+        data = text.encode()
+        if isinstance(self.archive, zipfile.ZipFile):
+            self.archive.writestr(name, data)
+        else:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = time.time()
+            info.mode = 0o600
+            self.archive.addfile(info, io.BytesIO(data))
+
+    def write_config(self, username, text):
+        name = self.config_name(username)
+        self.add(name, text)
+        return name
+
+    def write_index(self, name, text):
+        self.add(name, text)
+
+    def carry_over(self):
+        """Copy the members of the backup that were not written again, one at a time"""
+        if isinstance(self.archive, zipfile.ZipFile):
+            with zipfile.ZipFile(self.backup) as previous:
+                for info in previous.infolist():
+                    if info.filename not in self.written:
+                        self.archive.writestr(info, previous.read(info))
+        else:
+            with tarfile.open(self.backup) as previous:
+                for member in previous:
+                    if member.isfile() and member.name not in self.written:
+                        self.archive.addfile(member, previous.extractfile(member))
+
+    def close(self):
+        if self.archive is None:
+            return
+        if self.backup:
+            self.carry_over()
+        self.archive.close()
+
+
+def open_writer(output=default_output):
+    """Archive writer for .zip, .tar, .tar.gz and .tgz paths, directory writer otherwise"""
+    if output.endswith(archive_extensions):
+        return ArchiveWriter(output)
+    return DirectoryWriter(output)
@@ -0,0 +1,79 @@
+import base64
+import shutil
+import unittest
+import subprocess
+
+from wg_keys import x25519, BASE_POINT, genkey, pubkey, generate_keys, check_against_wg, X25519PrivateKey
+
+h = bytes.fromhex
+
+# RFC 7748 section 6.1
+alice_private = h("77076d0a7318a57d3c16c17251b26645df4c2f87ebc0992ab177fba51db92c2a")
+alice_public = h("8520f0098930a754748b7ddcb43ef75a0dbf3a0d26381af4eba4a98eaa9b4e6a")
+bob_private = h("5dab087e624a8a4b79e17f8b83800ee66f3bb1292618b6fd1c2f8b27ff88e0eb")
+bob_public = h("de9edb7d7b7dc1b4d35b61c2ece435373f8343c85b78674dadfc7e146f882b4f")
+shared_secret = h("4a5d9d5ba4ce2de1728e3bf480350f25e07e21c947d19e3376f09b3c1e161742")
+
+
+class X25519Vectors(unittest.TestCase):
+    """The pure-Python X25519 against the test vectors of RFC 7748"""
+
+    def test_scalar_multiplication(self):
+        # Section 5.2
+        self.assertEqual(
+            x25519(h("a546e36bf0527c9d3b16154b82465edd62144c0ac1fc5a18506a2244ba449ac4"),
+                   h("e6db6867583030db3594c1a424b15f7c726624ec26b3353b10a903a6d0ab1c4c")),
+            h("c3da55379de9c6908e94ea4df28d084f32eccf03491c71f754b4075577a28552"))
+        self.assertEqual(
+            x25519(h("4b66e9d4d1b4673c5ad22691957d6af5c11b6421e0ea01d42ca4169e7918ba0d"),
+                   h("e5210f12786811d3f4b7959d0538ae2c31dbe7106fc03c3efc4cd549c715a493")),
+            h("95cbde9476e8907d7aade45cb4b873f88b595a68799fa152e6f8f7647aac7957"))
+
+    def test_iterated(self):
+        # Section 5.2, after 1 and 1,000 iterations
+        k = u = BASE_POINT
+        for iteration in range(1, 1001):
+            k, u = x25519(k, u), k
+            if iteration == 1:
+                self.assertEqual(k, h("422c8e7a6227d7bca1350b3e2bb7279f7897b87bb6854b783c60e80311ae3079"))
+        self.assertEqual(k, h("684cf59ba83309552800ef566f2f4d3c1c3887c49360e3875f2eb94d99532c51"))
+
+    def test_diffie_hellman(self):
+        self.assertEqual(x25519(alice_private, BASE_POINT), alice_public)
+        self.assertEqual(x25519(bob_private, BASE_POINT), bob_public)
+        self.assertEqual(x25519(alice_private, bob_public), shared_secret)
+        self.assertEqual(x25519(bob_private, alice_public), shared_secret)
+
+    def test_pubkey_is_base64(self):
+        self.assertEqual(pubkey(base64.b64encode(alice_private).decode()), base64.b64encode(alice_public).decode())
+
+
+class Backends(unittest.TestCase):
+
+    def test_genkey_is_clamped(self):
+        key = base64.b64decode(genkey())
+        self.assertEqual(len(key), 32)
+        self.assertEqual(key[0] & 7, 0)
+        self.assertEqual(key[31] & 192, 64)
+
+    def test_generated_keys_match(self):
+        for privkey, public, psk in generate_keys(20, "python"):
+            self.assertEqual(pubkey(privkey), public)
+            self.assertEqual(len(base64.b64decode(psk)), 32)
+
+    @unittest.skipIf(X25519PrivateKey is None, "the cryptography package is not installed")
+    def test_cryptography_agrees(self):
+        for privkey, public, _ in generate_keys(20, "python"):
+            self.assertEqual(pubkey(privkey, "cryptography"), public)
+
+    @unittest.skipIf(shutil.which("wg") is None, "the wg binary is not installed")
+    def test_wg_pubkey_agrees(self):
+        self.assertEqual(check_against_wg(generate_keys(20, "python"), samples=20), [])
+        privkey = subprocess.run(["wg", "genkey"], stdout=subprocess.PIPE, text=True, check=True).stdout.strip()
+        expected = subprocess.run(["wg", "pubkey"], input=privkey, stdout=subprocess.PIPE, text=True,
+                                  check=True).stdout.strip()
+        self.assertEqual(pubkey(privkey), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
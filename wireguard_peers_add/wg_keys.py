@@ -0,0 +1,131 @@
+import os
+import base64
+import shutil
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+
+# Optional: the cryptography package computes X25519 public keys in C
+try:
+    from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey
+    from cryptography.hazmat.primitives.serialization import Encoding, PublicFormat
+except ImportError:
+    X25519PrivateKey = None
+
+# Peers per batch handed to a worker process
+batch_size = 256
+
+P = 2 ** 255 - 19
+A24 = 121665
+
+
+def x25519(scalar, u):
+    """RFC 7748 X25519 scalar multiplication on 32-byte little-endian strings"""
+    k = bytearray(scalar)
+    k[0] &= 248
+    k[31] &= 127
+    k[31] |= 64
+    k = int.from_bytes(k, "little")
+    x1 = int.from_bytes(u, "little") & ((1 << 255) - 1)
+
+    x2, z2, x3, z3, swap = 1, 0, x1, 1, 0
+    for t in reversed(range(255)):
+        bit = (k >> t) & 1
+        swap ^= bit
+        if swap:
+            x2, x3, z2, z3 = x3, x2, z3, z2
+        swap = bit
+        a, b = (x2 + z2) % P, (x2 - z2) % P
+        aa, bb = a * a % P, b * b % P
+        e = (aa - bb) % P
+        c, d = (x3 + z3) % P, (x3 - z3) % P
+        da, cb = d * a % P, c * b % P
+        x3 = (da + cb) ** 2 % P
+        z3 = x1 * (da - cb) ** 2 % P
+        x2 = aa * bb % P
+        z2 = e * (aa + A24 * e) % P
+    if swap:
+        x2, z2 = x3, z3
+    return (x2 * pow(z2, P - 2, P) % P).to_bytes(32, "little")
+
+
+BASE_POINT = (9).to_bytes(32, "little")
+
+
+def genkey():
+    """Same output as `wg genkey`: 32 random bytes clamped for Curve25519, base64"""
+    key = bytearray(os.urandom(32))
+    key[0] &= 248
+    key[31] &= 127
+    key[31] |= 64
+    return base64.b64encode(bytes(key)).decode()
+
+
+def genpsk():
+    """Same output as `wg genpsk`: 32 random bytes, base64"""
+    return base64.b64encode(os.urandom(32)).decode()
+
+
+def pubkey(privkey, backend="python"):
+    """Same output as `wg pubkey` for a base64 private key"""
+    raw = base64.b64decode(privkey)
+    if backend == "cryptography":
+        public = X25519PrivateKey.from_private_bytes(raw).public_key()
+        return base64.b64encode(public.public_bytes(Encoding.Raw, PublicFormat.Raw)).decode()
+    return base64.b64encode(x25519(raw, BASE_POINT)).decode()
+
+
+def wg_keypair():
+    """Generate a key set with the wg binary, three subprocesses"""
+    privkey = subprocess.run(["wg", "genkey"], stdout=subprocess.PIPE, text=True, check=True).stdout.strip()
+    public = subprocess.run(["wg", "pubkey"], input=privkey, stdout=subprocess.PIPE, text=True,
+                            check=True).stdout.strip()
+    psk = subprocess.run(["wg", "genpsk"], stdout=subprocess.PIPE, text=True, check=True).stdout.strip()
+    return privkey, public, psk
+
+
+def generate_batch(count, backend):
+    """Generate ``count`` (private key, public key, preshared key) tuples"""
+    if backend == "wg":
+        return [wg_keypair() for _ in range(count)]
+    keys = []
+    for _ in range(count):
+        privkey = genkey()
+        keys.append((privkey, pubkey(privkey, backend), genpsk()))
+    return keys
+
+
+def resolve_backend(backend="auto"):
+    """Pick the in-process backend, falling back to the wg binary only when asked"""
+    if backend == "auto":
+        return "cryptography" if X25519PrivateKey else "python"
+    if backend == "cryptography" and X25519PrivateKey is None:
+        raise RuntimeError("the cryptography package is not installed")
+    if backend == "wg" and shutil.which("wg") is None:
+        raise RuntimeError("the wg binary was not found")
+    return backend
+
+
+def generate_keys(count, backend="auto", processes=None):
+    """Generate key sets for ``count`` peers in batches.
+
+    In-process backends avoid three fork/execs per peer; with ``processes``
+    the batches are spread over a process pool.
+    """
+    backend = resolve_backend(backend)
+    batches = [min(batch_size, count - start) for start in range(0, count, batch_size)]
+    if not processes or processes <= 1 or len(batches) <= 1:
+        return [keys for size in batches for keys in generate_batch(size, backend)]
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        results = pool.map(generate_batch, batches, [backend] * len(batches))
+        return [keys for batch in results for keys in batch]
+
+
+def check_against_wg(keys, samples=5):
+    """Cross-check generated public keys with `wg pubkey`, returns the mismatches"""
+    mismatches = []
+    for privkey, public, _ in keys[:samples]:
+        expected = subprocess.run(["wg", "pubkey"], input=privkey, stdout=subprocess.PIPE, text=True,
+                                  check=True).stdout.strip()
+        if expected != public:
+            mismatches.append((public, expected))
+    return mismatches
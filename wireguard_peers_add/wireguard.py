@@ -1,14 +1,56 @@
+import io
 import os
 import sys
-import subprocess
-from csv import DictReader, DictWriter
+import argparse
+from csv import DictWriter
+from ipaddress import ip_interface
+from concurrent.futures import ThreadPoolExecutor
 import requests
 from requests.auth import HTTPBasicAuth
-import urllib3
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
-network = list()
-s = requests.Session()
+# Share the pooled session and retry helpers of the CTFd scripts
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "CTFd_initial_setup"))
+from ctfd_client import create_pooled_session, request_with_retry, default_retries
+from instrumentation import progress, instrumented_run, add_instrumentation_arguments
+from rosters import open_roster, add_roster_arguments
+
+from wg_keys import generate_keys, check_against_wg
+from address_pool import TunnelAddressPool
+from client_configs import ConfigTemplate, open_writer, default_output
+
+# Number of addClient calls sent to OPNsense in parallel
+default_workers = 8
+
+s = create_pooled_session()
+
+def read_api_key(path="apikey.txt"):
+    """Return the key and secret of an apikey.txt downloaded from OPNsense"""
+    with open(path, 'r') as tempfile:
+        df = list(tempfile)
+
+    for line in df:
+        if "key" in line:
+            api_user = line.split("\n")[0].split("key=")[1]
+        elif "secret" in line:
+            api_password = line.split("\n")[0].split("secret=")[1]
+    return api_user, api_password
+
+def parse_template(df):
+    """Return the addresses, DNS servers, OPNsense address and endpoint of the wireguard.conf lines"""
+    for line in df:
+        if "Address" in line:
+            template_addresses = [ip_interface(a.strip()) for a in line.split("\n")[0].split("Address = ")[1].split(",")]
+        elif "DNS" in line:
+            tmp = line.split("\n")[0].split("DNS = ")[1]
+            dns_addresses = tmp
+            if "," in tmp:
+                tmp = tmp.split(",")[0]
+            opnsense_ip = tmp
+        elif "Endpoint" in line:
+            tmp = line.split("\n")[0].split("Endpoint = ")[1].split(":")
+            endpoit_ip = tmp[0]
+            endpoint_port = int(tmp[1])
+    return template_addresses, dns_addresses, opnsense_ip, endpoit_ip, endpoint_port
 
 def get_server_uuid(opnsense_ip, api_user, api_password):
     r = s.get(
@@ -23,29 +65,172 @@ def get_server_uuid(opnsense_ip, api_user, api_password):
     else:
         sys.exit(0)
 
-def create_wireguard_peer(opnsense_ip, api_user, api_password, username, pubkey, tunneladdress, server_uuid, endpoit_ip, endpoint_port, psk):
-    r = s.post(
-        f"https://{opnsense_ip}/api/wireguard/client/addClient",
+def fetch_clients(opnsense_ip, api_user, api_password, page_size=1000):
+    """Return all WireGuard clients configured on OPNsense, usually in a single request"""
+    clients, current = [], 1
+    while True:
+        r = request_with_retry(
+            s, "GET",
+            f"https://{opnsense_ip}/api/wireguard/client/searchClient",
+            params={"current": current, "rowCount": page_size},
+            auth=HTTPBasicAuth(f"{api_user}", f"{api_password}"),
+            verify=False
+        )
+        r.raise_for_status()
+        output = r.json()
+        clients.extend(output["rows"])
+        if not output["rows"] or len(clients) >= int(output.get("total", 0)):
+            return clients
+        current += 1
+
+def find_client(opnsense_ip, api_user, api_password, name):
+    """The WireGuard client named ``name``, found with the searchClient filter, or None"""
+    r = request_with_retry(
+        s, "POST",
+        f"https://{opnsense_ip}/api/wireguard/client/searchClient",
         auth=HTTPBasicAuth(f"{api_user}", f"{api_password}"),
-        json={
-            "client": {
-                "enabled": "1",
-                "name": f"{username}",
-                "pubkey": f"{pubkey}",
-                "tunneladdress": f"{tunneladdress}",
-                "keepalive": "5",
-                "servers": f"{server_uuid}",
-                "serveraddress": f"{endpoit_ip}",
-                "serverport": f"{endpoint_port}",
-                "psk": f"{psk}",
-            }
-        },
-        headers={"Content-Type": "application/json"},
+        json={"current": 1, "rowCount": 1000, "searchPhrase": name},
         verify=False
     )
+    r.raise_for_status()
+    return next((c for c in r.json()["rows"] if c.get("name") == name), None)
 
+def create_wireguard_peer(opnsense_ip, api_user, api_password, username, pubkey, tunneladdress, server_uuid, endpoit_ip, endpoint_port, psk, retries=default_retries):
+    """Add a WireGuard client, returning its UUID or None when OPNsense refused it"""
+    try:
+        r = request_with_retry(
+            s, "POST",
+            f"https://{opnsense_ip}/api/wireguard/client/addClient",
+            retries=retries,
+            auth=HTTPBasicAuth(f"{api_user}", f"{api_password}"),
+            json={
+                "client": {
+                    "enabled": "1",
+                    "name": f"{username}",
+                    "pubkey": f"{pubkey}",
+                    "tunneladdress": f"{tunneladdress}",
+                    "keepalive": "5",
+                    "servers": f"{server_uuid}",
+                    "serveraddress": f"{endpoit_ip}",
+                    "serverport": f"{endpoint_port}",
+                    "psk": f"{psk}",
+                }
+            },
+            verify=False
+        )
+    except requests.ConnectionError as e:
+        progress.fail("peer", username, e)
+        return None
+
+    # OPNsense answers 200 with result "failed" and the validation errors
+    result = r.json() if r.status_code == 200 else {}
+    if result.get("result") != "saved" and r.attempts > 1 and "client.name" in (result.get("validations") or {}):
+        # An earlier attempt was saved before its response got lost, so the retry finds the name taken.
+        # The client is ours when it has the public key just sent.
+        try:
+            client = find_client(opnsense_ip, api_user, api_password, username)
+        except requests.RequestException:
+            client = None
+        if client and client.get("pubkey") == pubkey:
+            progress.ok("peer", username, uuid=client.get("uuid"), tunneladdress=tunneladdress, recovered=True)
+            return client.get("uuid", "")
+    if result.get("result") != "saved":
+        progress.fail("peer", username, f"{r.status_code} - {r.text}")
+        return None
+    progress.ok("peer", username, uuid=result.get("uuid"), tunneladdress=tunneladdress)
+    return result.get("uuid", "")
+
+def register_peers(opnsense_ip, api_user, api_password, server_uuid, endpoit_ip, endpoint_port, peers,
+                   workers=default_workers, retries=default_retries):
+    """Send the addClient calls of all peers concurrently, returning the usernames that failed"""
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(create_wireguard_peer, opnsense_ip, api_user, api_password, peer["username"], peer["pubkey"],
+                        peer["tunneladdress"], server_uuid, endpoit_ip, endpoint_port, peer["psk"], retries): peer
+            for peer in peers
+        }
+        return [futures[f]["username"] for f in futures if f.result() is None]
+
+def set_wireguard_peer(opnsense_ip, api_user, api_password, uuid, client, retries=default_retries):
+    """Update fields of an existing WireGuard client, e.g. {"enabled": "0"} or new keys"""
+    try:
+        r = request_with_retry(
+            s, "POST",
+            f"https://{opnsense_ip}/api/wireguard/client/setClient/{uuid}",
+            retries=retries,
+            auth=HTTPBasicAuth(f"{api_user}", f"{api_password}"),
+            json={"client": client},
+            verify=False
+        )
+    except requests.ConnectionError as e:
+        progress.fail("peer update", uuid, e)
+        return False
+    if r.status_code != 200 or r.json().get("result") != "saved":
+        progress.fail("peer update", uuid, f"{r.status_code} - {r.text}")
+        return False
+    progress.ok("peer update", uuid, fields=list(client))
+    return True
+
+def delete_wireguard_peer(opnsense_ip, api_user, api_password, uuid, retries=default_retries):
+    try:
+        r = request_with_retry(
+            s, "POST",
+            f"https://{opnsense_ip}/api/wireguard/client/delClient/{uuid}",
+            retries=retries,
+            auth=HTTPBasicAuth(f"{api_user}", f"{api_password}"),
+            verify=False
+        )
+    except requests.ConnectionError as e:
+        progress.fail("peer removal", uuid, e)
+        return False
     if r.status_code != 200:
-        print(False)
+        progress.fail("peer removal", uuid, f"{r.status_code} - {r.text}")
+        return False
+    progress.ok("peer removal", uuid)
+    return True
+
+def endpoint_clients(clients, endpoit_ip, endpoint_port):
+    """The clients pointing at this endpoint, i.e. the peers wireguard.py created"""
+    return [c for c in clients
+            if c.get("serveraddress") == endpoit_ip and str(c.get("serverport")) == str(endpoint_port)]
+
+def plan_reconcile(clients, usernames, endpoit_ip, endpoint_port, has_config):
+    """Diff the OPNsense clients against the roster.
+
+    Returns the usernames to add, the clients to re-enable (user back on the
+    roster), the clients whose local config is lost and need new keys, and
+    the departed clients. Only clients pointing at this endpoint are
+    considered departed, so peers added by hand for other purposes are left
+    alone.
+    """
+    by_name = {c["name"]: c for c in clients}
+    roster = set(usernames)
+    missing, enable, rekey = [], [], []
+    for username in usernames:
+        client = by_name.get(username)
+        if client is None:
+            missing.append(username)
+            continue
+        if str(client.get("enabled", "1")) == "0":
+            enable.append(client)
+        if not has_config(username):
+            rekey.append(client)
+    departed = [c for c in endpoint_clients(by_name.values(), endpoit_ip, endpoint_port) if c["name"] not in roster]
+    return missing, enable, rekey, departed
+
+def wireguard_reconfigure(opnsense_ip, api_user, api_password):
+    """Apply the WireGuard configuration without taking the firewall down"""
+    r = request_with_retry(
+        s, "POST",
+        f"https://{opnsense_ip}/api/wireguard/service/reconfigure",
+        auth=HTTPBasicAuth(f"{api_user}", f"{api_password}"),
+        verify=False
+    )
+    if r.status_code == 200:
+        print("WireGuard configuration applied.")
+        return True
+    print(f"Failed to apply WireGuard configuration: {r.status_code} - {r.text}")
+    return False
 
 def firewall_reboot(opnsense_ip, api_user, api_password):
     r = s.post(
@@ -54,96 +239,179 @@ def firewall_reboot(opnsense_ip, api_user, api_password):
         verify=False
     )
 
-try:
-    with open("apikey.txt", 'r') as tempfile:
-        df = list(tempfile)
-except:
-    sys.exit(0)
+def main(key_backend="auto", key_processes=None, check_wg=False, workers=default_workers, retries=default_retries,
+         reboot=False, tunnel_network=None, tunnel_network6=None, reconcile=False, departed_action="disable",
+         output_path=default_output, users_path="users.csv", skip_invalid=False):
+    try:
+        api_user, api_password = read_api_key()
+    except:
+        sys.exit(0)
+
+    try:
+        with open("wireguard.conf", 'r') as tempfile:
+            df = list(tempfile)
+    except:
+        sys.exit(0)
 
-for line in df:
-    if "key" in line:
-        api_user = line.split("\n")[0].split("key=")[1]
-    elif "secret" in line:
-        api_password = line.split("\n")[0].split("secret=")[1]
+    # Parsed once, each client config is then rendered with a single join
+    template = ConfigTemplate(df)
+    template_addresses, dns_addresses, opnsense_ip, endpoit_ip, endpoint_port = parse_template(df)
 
-try:
-    with open("wireguard.conf", 'r') as tempfile:
-        df = list(tempfile)
-except:
-    sys.exit(0)
-
-for line in df:
-    if "Address" in line:
-        tmp3 = []
-        tmp = line.split("\n")[0].split("Address = ")[1]
-        if "," in tmp:
-            tmp = tmp.split(",")
-            tmp1 = tmp[0].split("/32")[0].split(".")
-            network_inc = int(tmp1[-1])
-            for y in range(len(tmp1) - 1):
-                tmp3.append(tmp1[y])
-            network.append(".".join(tmp3) + ".")
-            if "::" in tmp[1]:
-                tmp2 = tmp[1].split("/128")[0].split("::")
-                network.append(tmp2[0] + "::")
-    elif "DNS" in line:
-        tmp = line.split("\n")[0].split("DNS = ")[1]
-        if "," in tmp:
-            tmp = tmp.split(",")[0]
-        opnsense_ip = tmp
-    elif "Endpoint" in line:
-        tmp = line.split("\n")[0].split("Endpoint = ")[1].split(":")
-        endpoit_ip = tmp[0]
-        endpoint_port = int(tmp[1])
-
-server_uuid = get_server_uuid(opnsense_ip, api_user, api_password)
-users = DictReader(open("users.csv"))
-os.makedirs("./wireguard", exist_ok=True)
-
-# Prepare for CSV export
-export_data = []
-
-for user in users:
-    email = user["email"]
-    username = email.split('@')[0]  # Extract username from email
-    result = subprocess.run(["wg", "genkey"], stdout=subprocess.PIPE, text=True)
-    privkey = result.stdout.strip()
-    result = subprocess.run(["wg", "pubkey"], input=privkey, stdout=subprocess.PIPE, text=True)
-    pubkey = result.stdout.strip()
-    result = subprocess.run(["wg", "genpsk"], stdout=subprocess.PIPE, text=True)
-    psk = result.stdout.strip()
-    network_inc += 1
-    tunneladdress = ""
-
-    for x in range(len(network)):
-        if x != 0:
-            tunneladdress += f",{network[x]}{network_inc}/128"
+    # Checked before the first call; kept in memory as keys are generated and reconciled for all users at once
+    users = list(open_roster(users_path, "users", skip_invalid))
+
+    server_uuid = get_server_uuid(opnsense_ip, api_user, api_password)
+
+    # Tunnel addresses come from the pool, seeded with the peers OPNsense already has
+    template_v4 = next(a.ip for a in template_addresses if a.version == 4)
+    template_v6 = next((a.ip for a in template_addresses if a.version == 6), None)
+    pool = TunnelAddressPool(tunnel_network or f"{template_v4}/24",
+                             tunnel_network6 or (f"{template_v6}/64" if template_v6 else None))
+    # Addresses of the pool up to the template itself are reserved, as before with the /24
+    template_offset = pool.offset_of(template_v4)
+    if template_offset is not None:
+        pool.mark_range(0, template_offset)
+    # The template and the firewall (DNS) addresses stay reserved in both families
+    for address in [str(a) for a in template_addresses] + dns_addresses.split(","):
+        try:
+            pool.mark_used(address)
+        except ValueError:
+            pass
+    clients = fetch_clients(opnsense_ip, api_user, api_password)
+    for client in clients:
+        try:
+            pool.mark_used(client.get("tunneladdress") or "")
+        except ValueError:
+            print(f"Ignoring the tunnel address {client.get('tunneladdress')!r} of peer {client.get('name')}")
+
+    output = open_writer(output_path)
+
+    plan, rekey_by_name = None, {}
+    if reconcile:
+        missing, enable, rekey, departed = plan_reconcile(
+            clients, [user["email"].split('@')[0] for user in users], endpoit_ip, endpoint_port,
+            output.has_config)
+        if departed_action == "keep":
+            departed = []
+        elif departed_action == "disable":
+            departed = [c for c in departed if str(c.get("enabled", "1")) != "0"]
+        print(f"Reconcile: {len(missing)} to add, {len(enable)} to re-enable, {len(rekey)} to re-key, "
+              f"{len(departed)} departed to {departed_action}, "
+              f"{len(users) - len(missing) - len(rekey)} unchanged.")
+        rekey_by_name = {c["name"]: c for c in rekey}
+        plan = set(missing) | set(rekey_by_name)
+        users = [user for user in users if user["email"].split('@')[0] in plan]
+
+    new_peers = len(users) - len(rekey_by_name)
+    if new_peers > pool.free_count():
+        print(f"{pool.network} has {pool.free_count()} free addresses for {new_peers} users, "
+              f"use --tunnel-network to pick a larger network")
+        sys.exit(1)
+
+    # Generate the keys of every peer in one batch instead of three wg calls per user
+    keys = generate_keys(len(users), key_backend, key_processes)
+    if check_wg:
+        mismatches = check_against_wg(keys)
+        if mismatches:
+            print(f"Generated public keys differ from wg pubkey: {mismatches}")
+            sys.exit(1)
+
+    # Prepare for CSV export
+    export_data, peers, rekeyed, configs = [], [], [], []
+
+    for user, (privkey, pubkey, psk) in zip(users, keys):
+        email = user["email"]
+        username = email.split('@')[0]  # Extract username from email
+        if username in rekey_by_name:
+            # The peer keeps its address, only its keys change
+            client = rekey_by_name[username]
+            tunneladdress = client["tunneladdress"]
+            rekeyed.append((client["uuid"], username, {"pubkey": pubkey, "psk": psk}))
         else:
-            tunneladdress += f"{network[x]}{network_inc}/32"
-
-    create_wireguard_peer(opnsense_ip, api_user, api_password, username, pubkey, tunneladdress, server_uuid, endpoit_ip, endpoint_port, psk)
-
-    config_path = f"./wireguard/wg-ctfd-{username}.conf"
-    with open(config_path, 'w') as tempfile:
-        for line in df:
-            if "PrivateKey" in line:
-                tempfile.write(f"PrivateKey = {privkey}\n")
-            elif "Address" in line:
-                tempfile.write(f"Address = {tunneladdress}\n")
-            elif "PresharedKey" in line:
-                tempfile.write(f"PresharedKey = {psk}\n")
+            tunneladdress = pool.allocate()
+            peers.append({"username": username, "pubkey": pubkey, "tunneladdress": tunneladdress, "psk": psk})
+        configs.append((user, username, privkey, tunneladdress, psk))
+
+    failed = []
+    if plan is not None:
+        # Updates of existing clients, sent concurrently like the additions
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            updates = [(name, executor.submit(set_wireguard_peer, opnsense_ip, api_user, api_password, uuid, fields,
+                                              retries)) for uuid, name, fields in rekeyed]
+            updates += [(c["name"], executor.submit(set_wireguard_peer, opnsense_ip, api_user, api_password,
+                                                    c["uuid"], {"enabled": "1"}, retries)) for c in enable]
+            if departed_action == "remove":
+                updates += [(c["name"], executor.submit(delete_wireguard_peer, opnsense_ip, api_user, api_password,
+                                                        c["uuid"], retries)) for c in departed]
             else:
-                tempfile.write(line)
+                updates += [(c["name"], executor.submit(set_wireguard_peer, opnsense_ip, api_user, api_password,
+                                                        c["uuid"], {"enabled": "0"}, retries)) for c in departed]
+            failed = [name for name, future in updates if not future.result()]
+        if not (peers or updates):
+            print("WireGuard peers are up to date.")
+            output.close()
+            return
+
+    failed += register_peers(opnsense_ip, api_user, api_password, server_uuid, endpoit_ip, endpoint_port, peers,
+                             workers, retries)
+    if failed:
+        # Their configs would not connect, so they are neither written nor mailed
+        print(f"{len(failed)} peers could not be added or updated: {', '.join(failed)}")
+    failed = set(failed)
 
-    password = user["password"]
-    # Append to export data
-    export_data.append({"username": username, "email": email,"password": password, "config_path": config_path})
+    for user, username, privkey, tunneladdress, psk in configs:
+        if username in failed:
+            continue
+        config_path = output.write_config(username, template.render(privkey, tunneladdress, psk))
+        export_data.append({"username": username, "email": user["email"], "password": user["password"],
+                            "config_path": config_path})
 
-# Export to CSV
-with open("mailmerge_database.csv", 'w', newline='') as csvfile:
+    # Export to CSV, also stored in the archive as its index
+    index = io.StringIO()
     fieldnames = ["username", "email", "password", "config_path"]
-    writer = DictWriter(csvfile, fieldnames=fieldnames)
+    writer = DictWriter(index, fieldnames=fieldnames)
     writer.writeheader()
     writer.writerows(export_data)
+    with open("mailmerge_database.csv", 'w', newline='') as csvfile:
+        csvfile.write(index.getvalue())
+    output.write_index("mailmerge_database.csv", index.getvalue())
+    output.close()
+
+    # A single reconfigure applies all new peers; a reboot is kept as an explicit fallback
+    if reboot:
+        firewall_reboot(opnsense_ip, api_user, api_password)
+    else:
+        wireguard_reconfigure(opnsense_ip, api_user, api_password)
 
-firewall_reboot(opnsense_ip, api_user, api_password)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create OPNsense WireGuard peers and client configs for users.csv")
+    parser.add_argument("--key-backend", choices=["auto", "python", "cryptography", "wg"], default="auto",
+                        help="how keys are generated: in-process (auto picks cryptography when installed) or the wg binary")
+    parser.add_argument("--key-processes", type=int, default=None,
+                        help="spread key generation over this many processes")
+    parser.add_argument("--check-wg", action="store_true",
+                        help="cross-check a sample of generated public keys with wg pubkey")
+    parser.add_argument("--workers", type=int, default=default_workers,
+                        help=f"number of peers registered in parallel (default: {default_workers})")
+    parser.add_argument("--retries", type=int, default=default_retries,
+                        help=f"retries for 429/5xx responses and connection errors (default: {default_retries})")
+    parser.add_argument("--reboot", action="store_true",
+                        help="reboot the firewall instead of reconfiguring the WireGuard service")
+    parser.add_argument("--tunnel-network",
+                        help="IPv4 network peer addresses are allocated from (default: the /24 of the template Address)")
+    parser.add_argument("--tunnel-network6",
+                        help="IPv6 network paired with it (default: the /64 of the template Address)")
+    parser.add_argument("--reconcile", action="store_true",
+                        help="only add the users missing on OPNsense and handle departed ones, keeping existing keys")
+    parser.add_argument("--departed", choices=["disable", "remove", "keep"], default="disable",
+                        help="what --reconcile does with peers no longer in users.csv (default: disable)")
+    parser.add_argument("--output", default=default_output,
+                        help="directory for the client configs, or a .zip, .tar, .tar.gz or .tgz archive "
+                             f"holding them all with the mail merge index (default: {default_output})")
+    add_roster_arguments(parser, "users.csv")
+    add_instrumentation_arguments(parser)
+    args = parser.parse_args()
+    with instrumented_run(args.metrics, args.trace, args.progress_interval, args.progress_log):
+        main(args.key_backend, args.key_processes, args.check_wg, args.workers, args.retries, args.reboot,
+             args.tunnel_network, args.tunnel_network6, args.reconcile, args.departed,
+             args.output, args.roster, args.skip_invalid)